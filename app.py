@@ -1,36 +1,123 @@
 # app.py
 import os
+import json
 import streamlit as st
 import requests
 
 # --- Configuration ---
 API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
+CONVERSATIONS_PAGE_SIZE = 20
+MESSAGES_PAGE_SIZE = 50
 
 
 # --- State Management & Callbacks ---
 def init_session_state():
-    defaults = {"token": None, "username": None, "messages": [], "conversations": [], "current_conversation_id": None}
+    defaults = {"token": None, "username": None, "messages": [], "messages_cursor": None, "conversations": [],
+                "conversations_cursor": None, "current_conversation_id": None, "http_cache": {}}
     for key, value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = value
 
 def new_chat_callback():
     st.session_state.messages = []
+    st.session_state.messages_cursor = None
     st.session_state.current_conversation_id = None
 
 def select_conversation_callback(conversation_id):
     try:
-        res = requests.get(f"{API_URL}/conversations/{conversation_id}", headers=get_auth_headers())
-        res.raise_for_status()
-        st.session_state.messages = res.json().get("messages", [])
+        page, cursor = fetch_messages(conversation_id)
+        st.session_state.messages = page
+        st.session_state.messages_cursor = cursor
         st.session_state.current_conversation_id = conversation_id
     except requests.RequestException:
         st.error("Could not load chat history.")
 
+def load_earlier_messages_callback():
+    try:
+        page, cursor = fetch_messages(st.session_state.current_conversation_id, st.session_state.messages_cursor)
+        st.session_state.messages = page + st.session_state.messages
+        st.session_state.messages_cursor = cursor
+    except requests.RequestException:
+        st.error("Could not load earlier messages.")
+
+def load_more_conversations_callback():
+    try:
+        page, cursor = fetch_conversations(st.session_state.conversations_cursor)
+        known = {c.get("id") for c in st.session_state.conversations}
+        st.session_state.conversations += [c for c in page if c.get("id") not in known]
+        st.session_state.conversations_cursor = cursor
+    except requests.RequestException:
+        st.error("Could not load older chats.")
+
 # --- API Functions ---
+def get_http_session():
+    """This browser session's keep-alive connection pool, reused across reruns.
+
+    Kept per session rather than shared, so one user's cookies never ride along
+    on another user's requests.
+    """
+    if "http_session" not in st.session_state:
+        st.session_state.http_session = requests.Session()
+    return st.session_state.http_session
+
 def get_auth_headers():
     return {"Authorization": f"Bearer {st.session_state.token}"} if st.session_state.token else {}
 
+def cached_get(path, params=None):
+    """GET revalidated with If-None-Match against this browser session's response cache.
+
+    Returns ``(json, headers)``; a 304 reuses the cached body, so reruns skip the
+    download and the server skips the conversation/page query. It still reads
+    the user's history version (one small Mongo lookup) to check the ETag.
+    """
+    key = (path, tuple(sorted((params or {}).items())))
+    entry = st.session_state.http_cache.get(key)
+    headers = get_auth_headers()
+    if entry:
+        headers["If-None-Match"] = entry["etag"]
+    res = get_http_session().get(f"{API_URL}{path}", params=params, headers=headers)
+    if res.status_code == 304 and entry:
+        return entry["body"], entry["headers"]
+    res.raise_for_status()
+    body = res.json()
+    if res.headers.get("ETag"):
+        st.session_state.http_cache[key] = {"etag": res.headers["ETag"], "body": body, "headers": res.headers}
+    return body, res.headers
+
+def fetch_conversations(after=None):
+    """One page of conversations, newest first, plus the cursor for the next page (None at the end)."""
+    params = {"limit": CONVERSATIONS_PAGE_SIZE}
+    if after:
+        params["after"] = after
+    body, headers = cached_get("/conversations", params)
+    return body, headers.get("X-Next-Cursor")
+
+def fetch_messages(conversation_id, after=None):
+    """One page of messages in display (oldest first) order, plus the cursor for earlier ones."""
+    params = {"limit": MESSAGES_PAGE_SIZE}
+    if after:
+        params["after"] = after
+    body, headers = cached_get(f"/conversations/{conversation_id}/messages", params)
+    return body["messages"][::-1], headers.get("X-Next-Cursor")
+
+def stream_chat(payload):
+    """Yields answer tokens from the /chat/stream Server-Sent Events endpoint."""
+    with get_http_session().post(f"{API_URL}/chat/stream", json=payload, headers=get_auth_headers(), stream=True) as res:
+        res.raise_for_status()
+        event = None
+        for line in res.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "token":
+                    yield data["content"]
+                elif event == "done":
+                    if st.session_state.current_conversation_id is None:
+                        st.session_state.current_conversation_id = data["conversation_id"]
+                elif event == "error":
+                    raise requests.RequestException(data.get("detail", "Streaming failed"))
+
 # --- UI Views ---
 def show_auth_view():
     st.sidebar.title("Welcome")
@@ -42,7 +129,7 @@ def show_auth_view():
         if st.form_submit_button(auth_choice):
             if auth_choice == "Login":
                 try:
-                    res = requests.post(f"{API_URL}/token", data={"username": username, "password": password})
+                    res = get_http_session().post(f"{API_URL}/token", data={"username": username, "password": password})
                     res.raise_for_status()
                     st.session_state.token = res.json()['access_token']
                     st.session_state.username = username
@@ -58,7 +145,7 @@ def show_auth_view():
                     st.error(f"Login failed: {detail}")
             else:  # Registration
                 try:
-                    res = requests.post(f"{API_URL}/register", json={"username": username, "password": password})
+                    res = get_http_session().post(f"{API_URL}/register", json={"username": username, "password": password})
                     res.raise_for_status()
                     st.success("Registration successful! Please login.")
                 except requests.RequestException as e:
@@ -82,17 +169,24 @@ def show_chat_view():
     st.sidebar.button("➕ New Chat", use_container_width=True, on_click=new_chat_callback)
 
     try:
-        res = requests.get(f"{API_URL}/conversations", headers=get_auth_headers())
-        res.raise_for_status()
-        st.session_state.conversations = res.json()
+        # Refresh only the newest page; older pages stay as loaded via "Load older chats"
+        latest, cursor = fetch_conversations()
+        latest_ids = {c.get("id") for c in latest}
+        older = [c for c in st.session_state.conversations if c.get("id") not in latest_ids]
+        st.session_state.conversations = latest + older
+        if not older:
+            st.session_state.conversations_cursor = cursor
     except requests.RequestException:
         st.session_state.conversations = []
+        st.session_state.conversations_cursor = None
 
     for convo in st.session_state.conversations:
         convo_id = convo.get("id") or convo.get("_id")  # fallback
         st.sidebar.button(convo['title'], key=convo_id,
                           use_container_width=True,
                           on_click=select_conversation_callback, args=(convo_id,))
+    if st.session_state.conversations_cursor:
+        st.sidebar.button("Load older chats", use_container_width=True, on_click=load_more_conversations_callback)
 
     # --- Sidebar: Clear / Delete Chat History ---
     st.sidebar.title("Chat Management")
@@ -101,12 +195,14 @@ def show_chat_view():
     if st.sidebar.button("🗑️ Clear Chat History"):
         if st.session_state.token:
             try:
-                res = requests.delete(f"{API_URL}/conversations", headers=get_auth_headers())
+                res = get_http_session().delete(f"{API_URL}/conversations", headers=get_auth_headers())
                 res.raise_for_status()
                 st.success("Chat history deleted!")
                 st.session_state.messages = []
                 st.session_state.conversations = []
+                st.session_state.conversations_cursor = None
                 st.session_state.current_conversation_id = None
+                st.session_state.messages_cursor = None
                 st.rerun()
             except requests.RequestException as e:
                 st.error(f"Failed to clear chat history: {e}")
@@ -117,7 +213,7 @@ def show_chat_view():
         convo_id = convo.get("id") or convo.get("_id")
         if st.sidebar.button(f"Delete: {convo['title']}", key=f"del_{convo_id}"):
             try:
-                res = requests.delete(f"{API_URL}/conversations/{convo_id}", headers=get_auth_headers())
+                res = get_http_session().delete(f"{API_URL}/conversations/{convo_id}", headers=get_auth_headers())
                 res.raise_for_status()
                 st.success(f"Deleted conversation: {convo['title']}")
                 # Remove from session state
@@ -126,6 +222,7 @@ def show_chat_view():
                 ]
                 if st.session_state.current_conversation_id == convo_id:
                     st.session_state.current_conversation_id = None
+                    st.session_state.messages_cursor = None
                     st.session_state.messages = []
                 st.rerun()
             except requests.RequestException as e:
@@ -149,25 +246,23 @@ def show_chat_view():
 
     # st.markdown("### Conversation")
     # st.markdown("""<h4 style='text-align: center; margin-top: -10px;'>Your personal medical AI assistant</h4>""", unsafe_allow_html=True)
+    if st.session_state.messages_cursor:
+        st.button("Load earlier messages", on_click=load_earlier_messages_callback)
     for msg in st.session_state.messages:
         with st.chat_message(msg['role']):
             st.markdown(msg['content'])
 
     if prompt := st.chat_input("Ask anything medical..."):
         st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.spinner("Thinking..."):
-            payload = {"prompt": prompt, "conversation_id": st.session_state.current_conversation_id}
-            try:
-                res = requests.post(f"{API_URL}/chat", json=payload, headers=get_auth_headers())
-                st.write("API status code:", res.status_code)
-                st.write("API response:", res.text)
-                res.raise_for_status()
-                data = res.json()
-                st.session_state.messages.append({"role": "assistant", "content": data['response']})
-                if st.session_state.current_conversation_id is None:
-                    st.session_state.current_conversation_id = data['conversation_id']
-            except requests.RequestException as e:
-                st.error(f"Error: {e}")
+        with st.chat_message("user"):
+            st.markdown(prompt)
+        payload = {"prompt": prompt, "conversation_id": st.session_state.current_conversation_id}
+        try:
+            with st.chat_message("assistant"):
+                answer = st.write_stream(stream_chat(payload))
+            st.session_state.messages.append({"role": "assistant", "content": answer})
+        except requests.RequestException as e:
+            st.error(f"Error: {e}")
         st.rerun()
 
 # --- Main App Controller ---
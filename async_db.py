@@ -0,0 +1,294 @@
+# async_db.py
+import os
+import json
+import base64
+from datetime import datetime
+from dotenv import load_dotenv
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+from ttl_cache import TTLCache
+import metrics
+
+load_dotenv()
+
+# Async counterpart of db.py for the API server; scripts keep using the blocking db module.
+# MONGO_URI="mongomock://" runs against an in-memory stand-in (pip install mongomock-motor).
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")  # e.g. secondaryPreferred
+
+CONVERSATIONS_PAGE_LIMIT = 20
+MESSAGES_PAGE_LIMIT = 50
+# Messages live in bucket documents of about this many messages (soft limit: one
+# write-behind flush may overshoot it), so appends and reads stay small however long a chat gets
+MESSAGE_BUCKET_SIZE = int(os.getenv("MESSAGE_BUCKET_SIZE", "50"))
+
+# username -> user document; per process, so keep the TTL short when running several workers
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))  # 0 disables the cache
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+user_cache = TTLCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+
+client = None
+db = None
+users_collection = None
+conversations_collection = None
+message_buckets_collection = None
+
+# --- Connection ---
+def connect(uri: str = None, database: str = "mediguide_db"):
+    """Creates the Motor client; call from the running event loop (e.g. the FastAPI lifespan)."""
+    global client, db, users_collection, conversations_collection, message_buckets_collection
+    uri = uri or MONGO_URI
+    if uri and uri.startswith("mongomock://"):
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(
+            uri,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            readPreference=MONGO_READ_PREFERENCE,
+        )
+    db = client[database]
+    users_collection = db.users
+    conversations_collection = db.conversations
+    message_buckets_collection = db.message_buckets
+    user_cache.clear()
+
+async def ensure_indexes():
+    """Creates the indexes the hot queries rely on; safe to run on every startup."""
+    try:
+        await users_collection.create_index("username", unique=True)
+    except OperationFailure as e:  # e.g. legacy duplicate usernames
+        print(f"⚠️ Could not create unique index on users.username: {e}")
+    # Serves the per-user listing and its keyset pagination without an in-memory sort
+    await conversations_collection.create_index([("username", 1), ("created_at", -1), ("_id", -1)])
+    # Newest-first message pages, and the open bucket lookup on append
+    await message_buckets_collection.create_index([("conversation_id", 1), ("first_at", -1), ("_id", -1)])
+    await message_buckets_collection.create_index([("conversation_id", 1), ("count", 1)])
+    await message_buckets_collection.create_index("username")
+    # Lets a retried write-behind flush find the messages that already landed
+    await message_buckets_collection.create_index("messages.id")
+
+async def ping():
+    """One round trip to the server; raises if it is unreachable within the selection timeout."""
+    await client.admin.command("ping")
+
+def close():
+    global client
+    if client is not None:
+        client.close()
+        client = None
+
+# --- Helpers ---
+def serialize_doc(doc):
+    """Convert MongoDB document (_id as ObjectId) into JSON serializable dict."""
+    if not doc:
+        return None
+    doc["id"] = str(doc["_id"])
+    del doc["_id"]
+    return doc
+
+def encode_cursor(position: dict) -> str:
+    """Opaque keyset cursor for a JSON-serializable position."""
+    raw = json.dumps(position)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, **fields) -> dict:
+    """Inverse of ``encode_cursor``, converting each field with its parser; raises ValueError if malformed."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return {key: parse(position[key]) for key, parse in fields.items()}
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+def bucket_append(conversation_oid: ObjectId, username: str, messages: list):
+    """``(filter, update)`` appending ``messages`` to the conversation's open bucket; upsert starts a new one.
+
+    The filter includes the owner, so an upserted bucket takes its ``username`` from it.
+    """
+    return (
+        {"conversation_id": conversation_oid, "username": username, "count": {"$lt": MESSAGE_BUCKET_SIZE}},
+        {
+            "$push": {"messages": {"$each": messages}},
+            "$inc": {"count": len(messages)},
+            "$setOnInsert": {"first_at": messages[0]["timestamp"]},
+        },
+    )
+
+# --- User Functions ---
+@metrics.timed("mongo_get_user")
+async def get_user(username: str):
+    """Fetches a user by their username (served from the user cache when fresh)."""
+    user = user_cache.get(username)
+    if user is None:
+        user = await users_collection.find_one({"username": username})
+        if user:
+            user_cache.put(username, user)
+    return user
+
+@metrics.timed("mongo_create_user")
+async def create_user(username: str, hashed_password: str):
+    """Inserts a new user into the database."""
+    result = await users_collection.insert_one({
+        "username": username,
+        "hashed_password": hashed_password,
+        "created_at": datetime.utcnow()
+    })
+    user_cache.invalidate(username)
+    return result
+
+@metrics.timed("mongo_get_history_version")
+async def get_history_version(username: str):
+    """Tag that changes whenever any of the user's conversations or messages is written or deleted."""
+    user = await users_collection.find_one({"username": username}, {"history_version": 1})
+    return f"{user['_id']}-{user.get('history_version', 0)}" if user else None
+
+def history_version_bump(username: str, writes: int = 1):
+    """``(filter, update)`` advancing the user's history version."""
+    return {"username": username}, {"$inc": {"history_version": writes}}
+
+@metrics.timed("mongo_bump_history_version")
+async def bump_history_version(username: str):
+    await users_collection.update_one(*history_version_bump(username))
+
+@metrics.timed("mongo_delete_user")
+async def delete_user(username: str):
+    """Removes a user and drops them from the user cache."""
+    result = await users_collection.delete_one({"username": username})
+    user_cache.invalidate(username)
+    return result
+
+# --- Conversation Functions ---
+@metrics.timed("mongo_get_user_conversations")
+async def get_user_conversations(username: str, limit: int = CONVERSATIONS_PAGE_LIMIT, after: str = None):
+    """Fetches one page of conversation metadata, newest first; returns ``(conversations, next_cursor)``."""
+    query = {"username": username}
+    if after:
+        position = decode_cursor(after, t=datetime.fromisoformat, id=ObjectId)
+        created_at, oid = position["t"], position["id"]
+        query["$or"] = [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "_id": {"$lt": oid}}]
+    cursor = conversations_collection.find(
+        query,
+        {"title": 1, "created_at": 1}  # Only what the listing returns; messages stay on the server
+    ).sort([("created_at", -1), ("_id", -1)]).limit(limit + 1)
+    convos = [c async for c in cursor]
+    last = convos[limit - 1] if len(convos) > limit else None
+    next_cursor = encode_cursor({"t": last["created_at"].isoformat(), "id": str(last["_id"])}) if last else None
+    return [serialize_doc(c) for c in convos[:limit]], next_cursor
+
+@metrics.timed("mongo_get_conversation_by_id")
+async def get_conversation_by_id(conversation_id: str, username: str):
+    """Fetches a single, complete conversation (all buckets, oldest first), ensuring the user owns it."""
+    convo = await conversations_collection.find_one({
+        "_id": ObjectId(conversation_id),
+        "username": username
+    })
+    if not convo:
+        return None
+    messages = convo.get("messages", [])  # not yet migrated to buckets
+    buckets = message_buckets_collection.find(
+        {"conversation_id": convo["_id"], "username": username}
+    ).sort([("first_at", 1), ("_id", 1)])
+    async for bucket in buckets:
+        messages.extend(bucket["messages"])
+    convo["messages"] = messages
+    return serialize_doc(convo)
+
+@metrics.timed("mongo_conversation_exists")
+async def conversation_exists(conversation_oid: ObjectId, username: str) -> bool:
+    """Whether the conversation exists and belongs to the user."""
+    return await conversations_collection.find_one({"_id": conversation_oid, "username": username}, {"_id": 1}) is not None
+
+@metrics.timed("mongo_get_conversation_messages")
+async def get_conversation_messages(conversation_id: str, username: str, limit: int = MESSAGES_PAGE_LIMIT,
+                                    after: str = None):
+    """Fetches one page of a conversation's messages, newest first; returns ``(messages, next_cursor)``.
+
+    The cursor is the bucket and the offset inside it where the page stopped, so
+    each page reads only the buckets it returns messages from. Returns None when
+    the user has no such conversation.
+    """
+    convo = await conversations_collection.find_one(
+        {"_id": ObjectId(conversation_id), "username": username}, {"messages": 1}
+    )
+    if not convo:
+        return None
+    position = decode_cursor(after, t=datetime.fromisoformat, b=ObjectId, i=int) if after else None
+    page, last = [], None
+    async for segment_id, first_at, stored in _message_segments(convo, username, position, limit):
+        stop = position["i"] if position and segment_id == position["b"] else len(stored)
+        if stop == 0:
+            continue
+        if len(page) == limit:  # full page and older messages remain
+            return page, encode_cursor(last)
+        take = min(stop, limit - len(page))
+        page.extend(reversed(stored[stop - take:stop]))
+        last = {"t": first_at.isoformat(), "b": str(segment_id), "i": stop - take}
+        if len(page) == limit and last["i"] > 0:
+            return page, encode_cursor(last)
+    return page, None
+
+async def _message_segments(convo: dict, username: str, position: dict, limit: int):
+    """Yields ``(id, first_at, messages)`` for the conversation's buckets from ``position`` on, newest first.
+
+    A conversation not yet migrated to buckets ends with its legacy ``messages``
+    array, which predates every bucket; it is keyed by the conversation id.
+    """
+    if not (position and position["b"] == convo["_id"]):  # the cursor is not already inside the legacy array
+        query = {"conversation_id": convo["_id"], "username": username}
+        if position:
+            query["$or"] = [{"first_at": {"$lt": position["t"]}},
+                            {"first_at": position["t"], "_id": {"$lte": position["b"]}}]
+        buckets = message_buckets_collection.find(query).sort([("first_at", -1), ("_id", -1)])
+        async for bucket in buckets.batch_size(limit // MESSAGE_BUCKET_SIZE + 2):
+            yield bucket["_id"], bucket["first_at"], bucket["messages"]
+    if convo.get("messages"):
+        yield convo["_id"], datetime.min, convo["messages"]
+
+@metrics.timed("mongo_create_conversation")
+async def create_conversation(username: str, first_message: dict):
+    """Creates a new conversation document with its first message bucket."""
+    result = await conversations_collection.insert_one({
+        "username": username,
+        "title": first_message['content'][:50] + "...",
+        "created_at": datetime.utcnow()
+    })
+    await add_messages_to_conversation(str(result.inserted_id), username, [first_message])
+    return result.inserted_id
+
+@metrics.timed("mongo_add_messages_to_conversation")
+async def add_messages_to_conversation(conversation_id: str, username: str, messages: list):
+    """Appends messages to the conversation's open bucket."""
+    await message_buckets_collection.update_one(
+        *bucket_append(ObjectId(conversation_id), username, messages), upsert=True
+    )
+    await bump_history_version(username)
+
+@metrics.timed("mongo_delete_user_conversations")
+async def delete_user_conversations(username: str) -> int:
+    """Deletes every conversation of a user; returns how many were removed."""
+    result = await conversations_collection.delete_many({"username": username})
+    await message_buckets_collection.delete_many({"username": username})
+    await bump_history_version(username)
+    return result.deleted_count
+
+@metrics.timed("mongo_delete_conversation")
+async def delete_conversation(conversation_id: str, username: str) -> int:
+    """Deletes one conversation if the user owns it; returns 1 or 0."""
+    result = await conversations_collection.delete_one({
+        "_id": ObjectId(conversation_id),
+        "username": username
+    })
+    if result.deleted_count:
+        await message_buckets_collection.delete_many({"conversation_id": ObjectId(conversation_id), "username": username})
+        await bump_history_version(username)
+    return result.deleted_count
@@ -1,10 +1,14 @@
 # auth.py
 import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from dotenv import load_dotenv
 from pydantic import BaseModel
+from ttl_cache import TTLCache
 
 load_dotenv()
 
@@ -17,9 +21,18 @@ class UserCreate(BaseModel):
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 ALGORITHM = os.getenv("JWT_ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))  # 0 disables the cache
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+# Verified token -> username; entries never outlive the token's own expiry
+token_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
 
 # --- Password Hashing Setup ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", str(4 * PASSWORD_HASH_WORKERS)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 def verify_password(plain_password, hashed_password):
     """Checks if the plain password matches the hashed one."""
@@ -29,6 +42,53 @@ def get_password_hash(password):
     """Generates a hash for a plain password."""
     return pwd_context.hash(password)
 
+# --- Password Hashing Pool ---
+# bcrypt releases the GIL, so a dedicated thread pool hashes on every core while the
+# request threadpool and the event loop stay free for /chat and /conversations.
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing pool already has PASSWORD_HASH_MAX_QUEUE jobs waiting."""
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_capacity = PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE
+# Updated from the event loop and from the pool's threads, so always under the lock
+_hash_lock = threading.Lock()
+_hash_stats = {"in_flight": 0, "peak_in_flight": 0, "completed": 0, "rejected": 0}
+
+def _release_slot(_future):
+    with _hash_lock:
+        _hash_stats["in_flight"] -= 1
+        _hash_stats["completed"] += 1
+
+async def _run_hashing(fn, *args):
+    with _hash_lock:
+        if _hash_stats["in_flight"] >= _hash_capacity:
+            _hash_stats["rejected"] += 1
+            raise PasswordHashingBusy()
+        _hash_stats["in_flight"] += 1
+        _hash_stats["peak_in_flight"] = max(_hash_stats["peak_in_flight"], _hash_stats["in_flight"])
+    future = _hash_executor.submit(fn, *args)
+    # Free the slot when the hash finishes, even if the request was cancelled meanwhile
+    future.add_done_callback(_release_slot)
+    return await asyncio.wrap_future(future)
+
+async def verify_password_async(plain_password, hashed_password):
+    """verify_password on the hashing pool; raises PasswordHashingBusy when saturated."""
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """get_password_hash on the hashing pool; raises PasswordHashingBusy when saturated."""
+    return await _run_hashing(get_password_hash, password)
+
+def hashing_stats() -> dict:
+    with _hash_lock:
+        stats = dict(_hash_stats)
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        **stats,
+    }
+
 # --- JWT Functions ---
 def create_access_token(data: dict):
     """Generates a new JWT access token."""
@@ -40,9 +100,15 @@ def create_access_token(data: dict):
 
 def verify_token(token: str):
     """Validates a token and extracts the username."""
+    username = token_cache.get(token)
+    if username:
+        return username
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        return username if username else None
+        if not username:
+            return None
+        token_cache.put(token, username, expires_at=payload.get("exp"))
+        return username
     except JWTError:
         return None
\ No newline at end of file
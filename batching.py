@@ -0,0 +1,145 @@
+# batching.py
+import os
+import time
+import asyncio
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import metrics
+from sharded_index import ShardedIndex
+from vector_index import search_by_vectors
+
+# --- Configuration ---
+RETRIEVAL_BATCH_WINDOW_MS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "2"))  # 0 disables batching
+RETRIEVAL_BATCH_MAX_SIZE = int(os.getenv("RETRIEVAL_BATCH_MAX_SIZE", "16"))
+
+
+class RetrievalBatcher:
+    """Coalesces concurrent retrievals into one batched embed + one batched FAISS search.
+
+    Requests are collected for up to ``window_ms`` after the first one arrives, or
+    until ``max_size`` are waiting; while a batch runs, new requests queue up and
+    form the next batch.
+    """
+
+    def __init__(self, vectorstore, k: int = 3, window_ms: float = RETRIEVAL_BATCH_WINDOW_MS,
+                 max_size: int = RETRIEVAL_BATCH_MAX_SIZE):
+        self.vectorstore = vectorstore
+        self.k = k
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self.batch_sizes = Counter()
+        self.queue_delays_ms = deque(maxlen=10_000)
+        self._loop = None
+        self._queue = None
+        self._task = None
+        # Own thread: sync callers block threads of the shared pools while they wait for a batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval-batch")
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def search(self, query: str, spans=None) -> List[Document]:
+        future = self._loop.create_future()
+        # The batch runs in its own task, so the request's spans travel with the query
+        spans = spans if spans is not None else metrics.current_spans()
+        await self._queue.put((query, future, time.perf_counter(), spans))
+        return await future
+
+    def search_threadsafe(self, query: str) -> List[Document]:
+        """Entry point for sync callers running in the threadpool."""
+        return asyncio.run_coroutine_threadsafe(self.search(query, metrics.current_spans()), self._loop).result()
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.window
+        while len(batch) < self.max_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            dispatched = time.perf_counter()
+            self.batch_sizes[len(batch)] += 1
+            self.queue_delays_ms.extend((dispatched - queued) * 1000 for _, _, queued, _ in batch)
+            try:
+                queries = [query for query, _, _, _ in batch]
+                results, embed_seconds, search_seconds = await self._loop.run_in_executor(
+                    self._executor, self._search_batch, queries)
+            except Exception as e:
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future, queued, spans), docs in zip(batch, results):
+                # Every request in the batch waited for the whole batched embed + search
+                metrics.record("batch_wait", dispatched - queued, spans)
+                metrics.record("embed", embed_seconds, spans)
+                metrics.record("faiss_search", search_seconds, spans)
+                if not future.done():
+                    future.set_result(docs)
+
+    def _search_batch(self, queries: List[str]):
+        """Returns the documents per query plus the embed and search times of the batch."""
+        embeddings = self.vectorstore.embeddings
+        # Reuse query vectors already computed for this request (e.g. by the semantic cache)
+        embed = getattr(embeddings, "embed_queries", embeddings.embed_documents)
+        started = time.perf_counter()
+        vectors = embed(queries)
+        embedded = time.perf_counter()
+        if isinstance(self.vectorstore, ShardedIndex):
+            # Fans out to the shards each query is routed to
+            docs = self.vectorstore.search_by_vectors(vectors, self.k, queries)
+        else:
+            docs = search_by_vectors(self.vectorstore, vectors, self.k)
+        return docs, embedded - started, time.perf_counter() - embedded
+
+    def stats(self) -> dict:
+        delays = np.array(self.queue_delays_ms) if self.queue_delays_ms else np.zeros(1)
+        return {
+            "batches": sum(self.batch_sizes.values()),
+            "requests": sum(size * count for size, count in self.batch_sizes.items()),
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "queue_delay_ms": {
+                "p50": float(np.percentile(delays, 50)),
+                "p95": float(np.percentile(delays, 95)),
+                "max": float(delays.max()),
+            },
+        }
+
+
+class BatchedRetriever(BaseRetriever):
+    """LangChain retriever that routes every query through a RetrievalBatcher."""
+
+    batcher: Any
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.batcher.search_threadsafe(query)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        return await self.batcher.search(query)
@@ -0,0 +1,61 @@
+"""Password verifications (logins) per second, overall and per core, for a range of bcrypt costs.
+
+Usage (from the repository root):
+    python -m benchmarks.bcrypt_throughput [--rounds 10 11 12] [--workers 1 2 4] [--seconds 3]
+
+Each worker count runs verify_password on a dedicated thread pool, the way
+``auth.verify_password_async`` does, so the numbers show how /token scales
+with PASSWORD_HASH_WORKERS and BCRYPT_ROUNDS on this machine.
+"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+
+def logins_per_second(context: CryptContext, hashed: str, workers: int, seconds: float) -> float:
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        done = 0
+        while time.perf_counter() < deadline:
+            context.verify("correct horse battery staple", hashed)
+            done += 1
+        return done
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        total = sum(pool.map(lambda _: worker(), range(workers)))
+    return total / (time.perf_counter() - started)
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12])
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, max(1, cores // 2), cores}))
+    parser.add_argument("--seconds", type=float, default=3.0, help="Measurement time per configuration.")
+    parser.add_argument("--output", help="Write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    results = []
+    for rounds in args.rounds:
+        context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        hashed = context.hash("correct horse battery staple")
+        for workers in args.workers:
+            rate = logins_per_second(context, hashed, workers, args.seconds)
+            per_core = rate / min(workers, cores)
+            results.append({"rounds": rounds, "workers": workers, "logins_per_s": rate,
+                            "logins_per_s_per_core": per_core})
+            print(f"rounds={rounds:>2}  workers={workers:>2}  {rate:8.1f} logins/s  "
+                  f"{per_core:7.1f} per core  ({1000 / per_core:.0f} ms per hash)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cores": cores, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
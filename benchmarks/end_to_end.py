@@ -0,0 +1,301 @@
+"""Offline end-to-end load test of the API: p50/p95/p99 latency and RPS per endpoint at set concurrency levels.
+
+Usage (from the repository root, with vectorstore/db_faiss built):
+    python -m benchmarks.end_to_end [--concurrency 1 8 32] [--turns 5] [--llm-latency-ms 300] [--llm-token-ms 15]
+    python -m benchmarks.end_to_end --output bench-$(git rev-parse --short HEAD).json
+
+Starts ``benchmarks.fake_openai`` and ``uvicorn main:app`` with LLM_ENDPOINTS pointing at
+the fake server and MONGO_URI=mongomock:// (``--mongo-uri`` for a local mongod), and waits
+for /readyz. The in-memory Mongo needs the pinned versions in requirements-dev.txt.
+At each concurrency level every virtual user registers, logs in, then runs
+``--turns`` rounds of POST /chat, POST /chat/stream and GET /conversations. Stage timings
+come from the app's Server-Timing header when it sends one (plus time to first token for
+the stream), and GET /stats is captured after each level. Afterwards every user's history
+is read back and compared with the turns that succeeded; the run exits non-zero if any
+were lost. No Groq quota or Atlas needed.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+PROMPTS = [
+    "What are the symptoms of dengue?",
+    "dengue ke symptoms kya hai",
+    "डेंगू के लक्षण क्या हैं?",
+    "How much paracetamol can an adult take in a day?",
+    "bukhar aur sar dard ho raha hai kya karu",
+    "How is malaria diagnosed?",
+    "What does a high HbA1c mean?",
+    "Side effects of amlodipine 5mg",
+    "normal platelet count range",
+    "When should I see a doctor for chest pain?",
+]
+PASSWORD = "benchmark-password"
+AUTH_ATTEMPTS = 20  # /register and /token answer 429 + Retry-After while the bcrypt pool is full
+
+
+class Results:
+    """Latencies, errors and Server-Timing stages of one concurrency level."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.stages = defaultdict(lambda: defaultdict(list))
+        self.errors = defaultdict(Counter)  # endpoint -> status code (or "failed") -> count
+        self.cached = Counter()
+        self.histories = []  # (headers, conversation_id, messages the server acknowledged)
+
+    def add(self, endpoint: str, started: float, response: httpx.Response = None):
+        if response is None or response.status_code >= 400:
+            self.errors[endpoint][str(response.status_code) if response is not None else "failed"] += 1
+            return
+        self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+        for stage, duration in parse_server_timing(response.headers.get("server-timing", "")).items():
+            self.stages[endpoint][stage].append(duration)
+
+    def summary(self, seconds: float) -> dict:
+        endpoints = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            samples = self.latencies[endpoint]
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": sum(self.errors[endpoint].values()),
+                "error_statuses": dict(self.errors[endpoint]),
+                "rps": round(len(samples) / seconds, 2),
+                **percentiles(samples),
+                "stages": {stage: percentiles(values) for stage, values in self.stages[endpoint].items()},
+            }
+        return endpoints
+
+
+def percentiles(samples) -> dict:
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2)}
+
+def parse_server_timing(header: str) -> dict:
+    """``retrieve;dur=12.5, llm;dur=830`` -> ``{"retrieve": 12.5, "llm": 830.0}``."""
+    stages = {}
+    for metric in filter(None, (part.strip() for part in header.split(","))):
+        name, *params = (p.strip() for p in metric.split(";"))
+        for param in params:
+            if param.startswith("dur="):
+                stages[name] = float(param[4:])
+    return stages
+
+async def timed(results: Results, endpoint: str, request):
+    started = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError:
+        response = None
+    results.add(endpoint, started, response)
+    return response
+
+async def chat_stream(client: httpx.AsyncClient, results: Results, body: dict, headers: dict) -> bool:
+    """Streams one answer; returns whether the done event (and with it the saved turn) arrived."""
+    started, first_token, event, timings, done = time.perf_counter(), None, None, {}, False
+    try:
+        async with client.stream("POST", "/chat/stream", json=body, headers=headers) as response:
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                    if first_token is None and event == "token":
+                        first_token = (time.perf_counter() - started) * 1000
+                    elif event == "error":  # the stream already answered 200
+                        response = None
+                        break
+                elif event == "done" and line.startswith("data: "):
+                    # Stages after the headers were sent only arrive in the done event
+                    timings = json.loads(line[len("data: "):]).get("timings", {})
+                    done = True
+    except httpx.HTTPError:
+        response = None
+    results.add("chat_stream", started, response)
+    if response is not None:
+        for stage, duration in timings.items():
+            results.stages["chat_stream"][stage].append(duration)
+    if first_token is not None:
+        results.stages["chat_stream"]["first_token"].append(first_token)
+    return done and response is not None
+
+async def authenticate(client: httpx.AsyncClient, results: Results, name: str):
+    """Registers and logs in, retrying 429s after Retry-After like a real client; returns the login response."""
+    requests = (("register", lambda: client.post("/register", json={"username": name, "password": PASSWORD})),
+                ("token", lambda: client.post("/token", data={"username": name, "password": PASSWORD})))
+    for endpoint, send in requests:
+        for _ in range(AUTH_ATTEMPTS):
+            response = await timed(results, endpoint, send())
+            if response is None or response.status_code != 429:
+                break
+            await asyncio.sleep(float(response.headers.get("retry-after", "1")))
+    return response
+
+async def virtual_user(client: httpx.AsyncClient, results: Results, name: str, offset: int, turns: int):
+    login = await authenticate(client, results, name)
+    if login is None or login.status_code >= 400:
+        return
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    conversation_id, acknowledged = None, 0
+    for turn in range(turns):
+        body = {"prompt": PROMPTS[(offset + turn) % len(PROMPTS)], "conversation_id": conversation_id}
+        reply = await timed(results, "chat", client.post("/chat", json=body, headers=headers))
+        if reply is not None and reply.status_code < 400:
+            conversation_id = reply.json()["conversation_id"]
+            results.cached[reply.json().get("cached", False)] += 1
+            acknowledged += 2  # the user message and the answer
+        if conversation_id and await chat_stream(client, results, dict(body, conversation_id=conversation_id), headers):
+            acknowledged += 2
+        await timed(results, "conversations", client.get("/conversations", headers=headers))
+    if conversation_id:
+        results.histories.append((headers, conversation_id, acknowledged))
+
+async def stored_messages(client: httpx.AsyncClient, headers: dict, conversation_id: str) -> int:
+    """Messages the server returns for a conversation, following X-Next-Cursor."""
+    count, after = 0, None
+    while True:
+        params = {"limit": 200, **({"after": after} if after else {})}
+        response = await client.get(f"/conversations/{conversation_id}/messages", params=params, headers=headers)
+        if response.status_code >= 400:
+            return count
+        count += len(response.json()["messages"])
+        after = response.headers.get("x-next-cursor")
+        if not after:
+            return count
+
+async def run_level(base_url: str, concurrency: int, turns: int, run_id: str) -> dict:
+    results = Results()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user(client, results, f"bench-{run_id}-c{concurrency}-u{i}", i, turns)
+                               for i in range(concurrency)))
+        seconds = time.perf_counter() - started
+        stats = (await client.get("/stats")).json()
+        await asyncio.sleep(1)  # let the write-behind queue flush the last turns
+        stored = await asyncio.gather(*(stored_messages(client, headers, conversation_id)
+                                        for headers, conversation_id, _ in results.histories))
+    total = sum(len(samples) for samples in results.latencies.values())
+    chats = results.cached[True] + results.cached[False]
+    return {
+        "concurrency": concurrency,
+        "seconds": round(seconds, 2),
+        "rps": round(total / seconds, 2),
+        "chat_cached_fraction": round(results.cached[True] / chats, 3) if chats else None,
+        "history_messages": {"acknowledged": sum(count for _, _, count in results.histories),
+                             "stored": sum(stored)},
+        "endpoints": results.summary(seconds),
+        "stats": stats,
+    }
+
+def start(command, env) -> subprocess.Popen:
+    """Runs ``command`` with its output in a temp file (a pipe nobody reads would fill and block it)."""
+    log = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+    process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT, text=True)
+    process.log = log
+    return process
+
+def wait_until(url: str, process: subprocess.Popen, timeout: float):
+    deadline, last = time.monotonic() + timeout, None
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            process.log.seek(0)
+            raise RuntimeError(f"{' '.join(process.args)} exited:\n{process.log.read()}")
+        try:
+            last = httpx.get(url, timeout=2)
+            if last.status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} not ready after {timeout:.0f}s: {last.text if last is not None else 'no response'}")
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--turns", type=int, default=5, help="chat + stream + list rounds per virtual user")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Fake LLM delay before the first token.")
+    parser.add_argument("--llm-token-ms", type=float, default=15.0, help="Fake LLM delay between tokens.")
+    parser.add_argument("--mongo-uri", default="mongomock://",
+                        help="e.g. mongodb://localhost:27017 for a local mongod; the default needs requirements-dev.txt")
+    parser.add_argument("--no-semantic-cache", action="store_true", help="Force every /chat through the LLM.")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--llm-port", type=int, default=8900)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--output", help="Write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONUNBUFFERED="1", MONGO_URI=args.mongo_uri, LLM_ENDPOINTS=json.dumps([{
+        "name": "fake", "model": "fake", "base_url": f"http://127.0.0.1:{args.llm_port}/v1", "api_key": "ok"}]))
+    env.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+    env.setdefault("JWT_ALGORITHM", "HS256")
+    if args.no_semantic_cache:
+        env["SEMANTIC_CACHE_THRESHOLD"] = "1.01"  # above any cosine similarity
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    llm = start([sys.executable, "-m", "benchmarks.fake_openai", "--port", str(args.llm_port),
+                 "--latency-ms", str(args.llm_latency_ms), "--token-ms", str(args.llm_token_ms)], env)
+    app = None
+    try:
+        wait_until(f"http://127.0.0.1:{args.llm_port}/docs", llm, 30)
+        app = start([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"], env)
+        started = time.perf_counter()
+        wait_until(f"{base_url}/readyz", app, args.startup_timeout)
+        ready_seconds = time.perf_counter() - started
+
+        run_id = uuid.uuid4().hex[:6]
+        levels = []
+        for concurrency in args.concurrency:
+            level = asyncio.run(run_level(base_url, concurrency, args.turns, run_id))
+            levels.append(level)
+            history = level["history_messages"]
+            print(f"concurrency {concurrency:>3}: {level['rps']:7.1f} req/s over {level['seconds']}s, "
+                  f"chat cached {level['chat_cached_fraction']}, "
+                  f"history {history['stored']}/{history['acknowledged']} messages stored")
+            for endpoint, r in level["endpoints"].items():
+                print(f"  {endpoint:>13}: n={r['requests']:<5} err={r['errors']:<3} {r['rps']:7.2f} rps  "
+                      f"p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms  {r['error_statuses'] or ''}")
+    finally:
+        for process in (app, llm):
+            if process is not None:
+                process.terminate()
+                process.wait(30)
+
+    results = {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": vars(args),
+        "ready_seconds": round(ready_seconds, 2),
+        "levels": levels,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    lost = [level["concurrency"] for level in levels
+            if level["history_messages"]["stored"] != level["history_messages"]["acknowledged"]]
+    if lost:
+        # e.g. an in-memory Mongo that does not match the installed pymongo (see requirements-dev.txt)
+        raise SystemExit(f"❌ Chat history does not match the acknowledged turns at concurrency {lost}; "
+                         f"check persistence_queue.failed in the /stats snapshot.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Local OpenAI-compatible chat server for exercising LLM failover, hedging and load tests offline.
+
+Usage (from the repository root):
+    python -m benchmarks.fake_openai [--port 8900] [--latency-ms 300] [--token-ms 15]
+
+Each request's behaviour comes from its API key, so one server can stand in for
+a whole endpoint pool:
+
+    ok            normal answer
+    slow-<ms>     adds <ms> before the first token
+    status-<code> fails with that HTTP status (e.g. status-429 for a rate limit)
+    flaky-<p>     fails with a 500 with probability p
+
+Point the router at it, e.g.
+    LLM_ENDPOINTS='[{"name": "primary", "model": "fake", "base_url": "http://127.0.0.1:8900/v1", "api_key": "status-429"},
+                    {"name": "fallback", "model": "fake", "base_url": "http://127.0.0.1:8900/v1", "api_key": "ok"}]'
+"""
+import time
+import json
+import uuid
+import random
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = ("1. Aapko rest lena chahiye and drink plenty of fluids. 2. Paracetamol can help with the fever. "
+          "3. If symptoms continue for more than three days, please consult a doctor.")
+
+app = FastAPI(title="Fake OpenAI-compatible API")
+settings = {"latency_ms": 300.0, "token_ms": 15.0}
+
+
+def behaviour(request: Request):
+    """Returns ``(extra_delay_s, error_status)`` for the request's API key."""
+    key = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    kind, _, value = key.partition("-")
+    if kind == "slow":
+        return float(value) / 1000, None
+    if kind == "status":
+        return 0.0, int(value)
+    if kind == "flaky" and random.random() < float(value):
+        return 0.0, 500
+    return 0.0, None
+
+def completion_chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    return "data: " + json.dumps({
+        "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }) + "\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    delay, status = behaviour(request)
+    await asyncio.sleep(settings["latency_ms"] / 1000 + delay)
+    if status:
+        return JSONResponse({"error": {"message": f"Simulated {status}", "type": "fake_error"}}, status_code=status)
+
+    model, completion_id = body.get("model", "fake"), f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    tokens = [word + " " for word in ANSWER.split()]
+    if body.get("stream"):
+        async def events():
+            yield completion_chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for token in tokens:
+                await asyncio.sleep(settings["token_ms"] / 1000)
+                yield completion_chunk(completion_id, model, {"content": token})
+            yield completion_chunk(completion_id, model, {}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(settings["token_ms"] * len(tokens) / 1000)
+    return {
+        "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                     "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": len(str(body.get("messages", ""))) // 4, "completion_tokens": len(tokens),
+                  "total_tokens": len(str(body.get("messages", ""))) // 4 + len(tokens)},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Delay before the first token.")
+    parser.add_argument("--token-ms", type=float, default=15.0, help="Delay between streamed tokens.")
+    args = parser.parse_args()
+    settings.update(latency_ms=args.latency_ms, token_ms=args.token_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Hit rate and per-query latency: dense-only vs hybrid (BM25 + dense, reciprocal rank fusion).
+
+Usage (from the repository root):
+    python -m benchmarks.hybrid_retrieval [--queries labeled.jsonl] [--samples 200] [--k 3]
+
+``--queries`` is a JSONL file of ``{"query": ..., "relevant": [chunk_id, ...]}``.
+Without it, queries are short spans of text from sampled chunks (the exact terms
+users type for drug names and dosages) and the source chunk is the expected hit.
+Sharded indexes (``memory_llm.py --shard-by``) are searched as the server does.
+"""
+import os
+import json
+import time
+import random
+import argparse
+
+import numpy as np
+
+from embeddings import get_embedding_model
+from sharded_index import ShardedIndex
+from sparse_index import BM25_DIR_NAME, HYBRID_CANDIDATES, BM25Index, HybridRetriever
+from vector_index import load_vectorstore
+
+
+def chunk_ids(db) -> list:
+    """Every chunk id in the index, loading each shard of a sharded one."""
+    stores = [db.load(shard) for shard in db.shards.values()] if isinstance(db, ShardedIndex) else [db]
+    return [store.index_to_docstore_id[row] for store in stores for row in range(store.index.ntotal)]
+
+def synthetic_queries(db, samples: int, span: int, seed: int = 0):
+    rng = random.Random(seed)
+    ids = chunk_ids(db)
+    queries = []
+    for chunk_id in rng.sample(ids, min(samples, len(ids))):
+        words = db.docstore.search(chunk_id).page_content.split()
+        if len(words) < span:
+            continue
+        start = rng.randrange(len(words) - span + 1)
+        queries.append({"query": " ".join(words[start:start + span]), "relevant": [chunk_id]})
+    return queries
+
+def evaluate(retriever, queries, k: int) -> dict:
+    retriever.invoke(queries[0]["query"])  # warm-up
+    hits, latencies = 0, []
+    for q in queries:
+        started = time.perf_counter()
+        docs = retriever.invoke(q["query"])
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += bool({doc.id for doc in docs[:k]} & set(q["relevant"]))
+    return {
+        f"hit_rate@{k}": hits / len(queries),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "mean_ms": float(np.mean(latencies)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="vectorstore/db_faiss")
+    parser.add_argument("--queries", help="Labeled JSONL query set.")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--span", type=int, default=6, help="Words per synthetic query.")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--output", help="Write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    db = load_vectorstore(args.db, get_embedding_model())
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+    else:
+        queries = synthetic_queries(db, args.samples, args.span)
+
+    bm25 = db.sparse_index() if isinstance(db, ShardedIndex) else BM25Index(os.path.join(args.db, BM25_DIR_NAME))
+    dense = db.as_retriever(search_kwargs={"k": args.k})
+    hybrid = HybridRetriever(dense=db.as_retriever(search_kwargs={"k": HYBRID_CANDIDATES}),
+                             bm25=bm25, vectorstore=db, k=args.k)
+    results = {"queries": len(queries), "dense": evaluate(dense, queries, args.k),
+               "hybrid": evaluate(hybrid, queries, args.k)}
+
+    for name in ("dense", "hybrid"):
+        r = results[name]
+        print(f"{name:>6}: hit@{args.k}={r[f'hit_rate@{args.k}']:.3f}  "
+              f"p50={r['p50_ms']:.2f}ms  p95={r['p95_ms']:.2f}ms  mean={r['mean_ms']:.2f}ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Encode time and bytes on the wire for a conversation payload: default FastAPI path vs orjson, plain/gzip/brotli.
+
+Usage (from the repository root):
+    python -m benchmarks.json_encoding [--messages 1000] [--repeats 50]
+
+The default path is what a plain ``return {...}`` costs: ``jsonable_encoder``
+followed by ``JSONResponse.render``. The fast path is ``orjson.dumps`` on the
+raw document, as ``main.conversation_json`` does.
+"""
+import json
+import time
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+import orjson
+
+from compression import brotli, compress
+
+
+def synthetic_history(count: int) -> dict:
+    start = datetime.now(timezone.utc)
+    return {"messages": [{
+        "role": "user" if i % 2 == 0 else "assistant",
+        "content": (f"Question {i}: mujhe teen din se bukhar hai, kya karna chahiye?" if i % 2 == 0 else
+                    f"Answer {i}: 1. Rest karein and drink plenty of fluids. 2. Paracetamol 500mg may help. "
+                    "3. If the fever persists beyond 3 days, please consult a doctor immediately."),
+        "timestamp": start + timedelta(seconds=i),
+    } for i in range(count)]}
+
+def time_ms(fn, repeats: int) -> float:
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return float(np.median(samples))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--output", help="Write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    payload = synthetic_history(args.messages)
+    default_body = JSONResponse(jsonable_encoder(payload)).body
+    fast_body = orjson.dumps(payload)
+    results = {
+        "messages": args.messages,
+        "encode_ms": {
+            "jsonable_encoder+json": time_ms(lambda: JSONResponse(jsonable_encoder(payload)).body, args.repeats),
+            "orjson": time_ms(lambda: orjson.dumps(payload), args.repeats),
+        },
+        "bytes": {"default": len(default_body), "orjson": len(fast_body),
+                  "gzip": len(compress(fast_body, "gzip"))},
+        "compress_ms": {"gzip": time_ms(lambda: compress(fast_body, "gzip"), args.repeats)},
+    }
+    if brotli is not None:
+        results["bytes"]["br"] = len(compress(fast_body, "br"))
+        results["compress_ms"]["br"] = time_ms(lambda: compress(fast_body, "br"), args.repeats)
+
+    for name, value in results["encode_ms"].items():
+        print(f"encode  {name:>22}: {value:8.2f} ms")
+    for name, value in results["compress_ms"].items():
+        print(f"compress {name:>21}: {value:8.2f} ms")
+    for name, value in results["bytes"].items():
+        print(f"bytes   {name:>22}: {value:8d}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
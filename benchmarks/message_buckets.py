@@ -0,0 +1,102 @@
+"""Append and read latency vs conversation length: one growing messages array vs message buckets.
+
+Usage (from the repository root, against a scratch database on MONGO_URI):
+    python -m benchmarks.message_buckets [--lengths 100 1000 5000] [--repeats 50]
+
+The legacy layout pushes into and reads back one ``messages`` array; the bucketed
+layout appends through ``async_db.add_messages_to_conversation`` and reads the
+newest page with ``async_db.get_conversation_messages``. Numbers from a real
+mongod are the meaningful ones; ``MONGO_URI=mongomock://`` only checks the script.
+"""
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from bson.objectid import ObjectId
+
+import async_db
+
+DATABASE = "vaidya_benchmark"
+
+
+def fake_messages(count: int, start: datetime):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i} " + "lorem ipsum " * 20,
+             "timestamp": start + timedelta(seconds=i)} for i in range(count)]
+
+def summarize(latencies) -> dict:
+    return {"p50_ms": float(np.percentile(latencies, 50)), "p95_ms": float(np.percentile(latencies, 95))}
+
+async def timed(repeats: int, operation) -> dict:
+    latencies = []
+    for i in range(repeats):
+        started = time.perf_counter()
+        await operation(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return summarize(latencies)
+
+async def bench_length(length: int, repeats: int) -> dict:
+    start = datetime.now(timezone.utc)
+    history = fake_messages(length, start)
+    extra = fake_messages(repeats, start + timedelta(days=1))
+    legacy = async_db.db.legacy_conversations
+
+    legacy_id = (await legacy.insert_one({"username": "bench", "messages": history})).inserted_id
+    legacy_append = await timed(repeats, lambda i: legacy.update_one(
+        {"_id": legacy_id}, {"$push": {"messages": extra[i]}}))
+    legacy_read = await timed(repeats, lambda i: legacy.find_one({"_id": legacy_id}))
+
+    conversation_id = str(ObjectId())
+    # get_conversation_messages only reads conversations the user owns
+    await async_db.conversations_collection.insert_one(
+        {"_id": ObjectId(conversation_id), "username": "bench", "title": "bench", "created_at": start})
+    size = async_db.MESSAGE_BUCKET_SIZE
+    await async_db.message_buckets_collection.insert_many([
+        {"conversation_id": ObjectId(conversation_id), "username": "bench", "messages": history[i:i + size],
+         "count": len(history[i:i + size]), "first_at": history[i]["timestamp"]}
+        for i in range(0, length, size)
+    ])
+    bucket_append = await timed(repeats, lambda i: async_db.add_messages_to_conversation(
+        conversation_id, "bench", [extra[i]]))
+    limit = async_db.MESSAGES_PAGE_LIMIT
+    result = await async_db.get_conversation_messages(conversation_id, "bench", limit)
+    expected = min(limit, length + repeats)
+    assert result is not None and len(result[0]) == expected, \
+        f"read returned {None if result is None else len(result[0])} messages, expected {expected}"
+    bucket_read = await timed(repeats, lambda i: async_db.get_conversation_messages(conversation_id, "bench", limit))
+
+    return {"length": length,
+            "legacy": {"append": legacy_append, "read_all": legacy_read},
+            "buckets": {"append": bucket_append, "read_page": bucket_read}}
+
+async def run(lengths, repeats):
+    async_db.connect(database=DATABASE)
+    await async_db.ensure_indexes()
+    try:
+        return [await bench_length(length, repeats) for length in lengths]
+    finally:
+        await async_db.client.drop_database(DATABASE)
+        async_db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--output", help="Write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.lengths, args.repeats))
+    for r in results:
+        print(f"{r['length']:>6} msgs  legacy append p50={r['legacy']['append']['p50_ms']:.2f}ms "
+              f"read p50={r['legacy']['read_all']['p50_ms']:.2f}ms | "
+              f"buckets append p50={r['buckets']['append']['p50_ms']:.2f}ms "
+              f"read page p50={r['buckets']['read_page']['p50_ms']:.2f}ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Per-worker private vs shared memory of the gunicorn deployment: one copy per worker vs preload + mmap.
+
+Usage (from the repository root, with vectorstore/db_faiss built; Linux only):
+    python -m benchmarks.worker_memory [--workers 4] [--modes baseline preload]
+
+Each mode starts ``gunicorn main:app -c gunicorn.conf.py`` with MONGO_URI=mongomock://,
+waits until every worker has loaded the RAG chain, then reads ``/proc/<pid>/smaps_rollup``
+of the master and each worker. Private bytes are what each extra worker really costs;
+PSS splits shared pages between the processes mapping them, so the PSS total is the
+deployment's actual footprint.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import subprocess
+
+MODES = {
+    "baseline": {"PRELOAD_MODELS": "0", "FAISS_MMAP": "0"},  # every worker loads its own model and index
+    "preload": {"PRELOAD_MODELS": "1", "FAISS_MMAP": "1"},
+}
+READY_LINE = "RAG chain with compassionate doctor prompt loaded successfully"
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def smaps_rollup(pid: int) -> dict:
+    """Memory counters of one process in MB."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in SMAPS_FIELDS:
+                values[name] = int(rest.split()[0]) / 1024
+    return {
+        "rss_mb": round(values["Rss"], 1),
+        "pss_mb": round(values["Pss"], 1),
+        "shared_mb": round(values["Shared_Clean"] + values["Shared_Dirty"], 1),
+        "private_mb": round(values["Private_Clean"] + values["Private_Dirty"], 1),
+    }
+
+def child_pids(parent: int):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == parent:
+            pids.append(int(entry))
+    return sorted(pids)
+
+def measure(mode: str, workers: int, port: int, timeout: float) -> dict:
+    env = dict(os.environ, **MODES[mode], PYTHONUNBUFFERED="1")
+    env.setdefault("MONGO_URI", "mongomock://")
+    if not any(env.get(k) for k in ("LLM_ENDPOINTS", "PRIMARY_GROQ_API_KEY", "FALLBACK_GROQ_API_KEY", "TOGETHER_API_KEY")):
+        # The router is built at startup but never called here
+        env["LLM_ENDPOINTS"] = json.dumps([{"name": "unused", "model": "unused",
+                                           "base_url": "http://127.0.0.1:9/v1", "api_key": "unused"}])
+    started = time.perf_counter()
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py",
+         "--workers", str(workers), "--bind", f"127.0.0.1:{port}"],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    loaded, all_loaded = [0], threading.Event()
+
+    def follow_output():
+        for line in master.stdout:
+            if READY_LINE in line:
+                loaded[0] += 1
+                if loaded[0] >= workers:
+                    all_loaded.set()
+            elif "Error" in line or "❌" in line:
+                print(f"  [{mode}] {line.rstrip()}")
+
+    threading.Thread(target=follow_output, daemon=True).start()
+    try:
+        if not all_loaded.wait(timeout):
+            raise RuntimeError(f"{mode}: only {loaded[0]}/{workers} workers loaded within {timeout:.0f}s")
+        ready_seconds = time.perf_counter() - started
+        time.sleep(2)  # let the warm-up queries settle
+        worker_stats = [smaps_rollup(pid) for pid in child_pids(master.pid)]
+        master_stats = smaps_rollup(master.pid)
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(30)
+
+    return {
+        "mode": mode,
+        "env": MODES[mode],
+        "workers": len(worker_stats),
+        "ready_seconds": round(ready_seconds, 1),
+        "master": master_stats,
+        "per_worker": worker_stats,
+        "mean_worker_private_mb": round(sum(w["private_mb"] for w in worker_stats) / len(worker_stats), 1),
+        "mean_worker_shared_mb": round(sum(w["shared_mb"] for w in worker_stats) / len(worker_stats), 1),
+        "total_pss_mb": round(master_stats["pss_mb"] + sum(w["pss_mb"] for w in worker_stats), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for every worker to load.")
+    parser.add_argument("--output", help="Write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        r = measure(mode, args.workers, args.port, args.timeout)
+        results.append(r)
+        print(f"{mode:>9}: {r['workers']} workers ready in {r['ready_seconds']}s | per worker "
+              f"private {r['mean_worker_private_mb']} MB, shared {r['mean_worker_shared_mb']} MB | "
+              f"master RSS {r['master']['rss_mb']} MB | total PSS {r['total_pss_mb']} MB")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
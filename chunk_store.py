@@ -0,0 +1,123 @@
+# chunk_store.py
+import os
+import json
+import pickle
+import sqlite3
+import argparse
+import threading
+from collections.abc import Mapping
+from typing import Union
+
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+CHUNK_STORE_NAME = "chunks.sqlite"
+MMAP_SIZE = int(os.getenv("CHUNK_STORE_MMAP_BYTES", str(1 << 30)))
+
+
+# --- Writing ---
+def write_chunk_store(docstore, index_to_docstore_id, db_path: str) -> str:
+    """Writes every chunk, keyed by its FAISS row, into ``chunks.sqlite`` inside ``db_path``."""
+    path = os.path.join(db_path, CHUNK_STORE_NAME)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute(
+            "CREATE TABLE chunks (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        rows = []
+        for position, chunk_id in index_to_docstore_id.items():
+            doc = docstore.search(chunk_id)
+            rows.append((int(position), chunk_id, doc.page_content, json.dumps(doc.metadata, default=str)))
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return path
+
+def convert_pickle(db_path: str) -> str:
+    """Builds ``chunks.sqlite`` from an existing ``index.pkl`` (InMemoryDocstore + id map)."""
+    with open(os.path.join(db_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return write_chunk_store(docstore, index_to_docstore_id, db_path)
+
+
+# --- Reading ---
+class _Connections:
+    """One read-only, memory-mapped SQLite connection per thread (and per process after fork)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+
+class SqliteDocstore(Docstore):
+    """Read-only docstore that materializes a chunk only when retrieval asks for it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connections = _Connections(path)
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self._connections.get().execute(
+            "SELECT text, metadata FROM chunks WHERE id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts):
+        raise NotImplementedError("The chunk store is read-only; rebuild it with memory_llm.py.")
+
+    def delete(self, ids):
+        raise NotImplementedError("The chunk store is read-only; rebuild it with memory_llm.py.")
+
+
+class SqliteIdMap(Mapping):
+    """FAISS row -> chunk id, looked up on demand instead of unpickled up front."""
+
+    def __init__(self, path: str):
+        self._connections = _Connections(path)
+
+    def __getitem__(self, position) -> str:
+        row = self._connections.get().execute(
+            "SELECT id FROM chunks WHERE position = ?", (int(position),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self):
+        return (row[0] for row in self._connections.get().execute("SELECT position FROM chunks ORDER BY position"))
+
+    def __len__(self) -> int:
+        return self._connections.get().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+
+def has_chunk_store(db_path: str) -> bool:
+    return os.path.exists(os.path.join(db_path, CHUNK_STORE_NAME))
+
+def open_chunk_store(db_path: str):
+    """Returns ``(docstore, index_to_docstore_id)`` backed by ``chunks.sqlite``."""
+    path = os.path.join(db_path, CHUNK_STORE_NAME)
+    return SqliteDocstore(path), SqliteIdMap(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the pickled FAISS docstore into an on-disk chunk store.")
+    parser.add_argument("db_path", nargs="?", default="vectorstore/db_faiss")
+    args = parser.parse_args()
+    print(f"Wrote {convert_pickle(args.db_path)}")
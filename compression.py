@@ -0,0 +1,74 @@
+# compression.py
+import os
+import gzip
+from typing import Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4  # close to gzip -6 speed with noticeably smaller output
+
+
+def choose_encoding(accept_encoding: str):
+    """Brotli when the client accepts it and the package is installed, else gzip, else None."""
+    offered = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class PathCompressionMiddleware:
+    """ASGI middleware compressing buffered responses under the given path prefixes.
+
+    Only listed paths are touched, so the SSE stream at /chat/stream is never
+    buffered, and bodies below ``minimum_size`` are sent as they are.
+    """
+
+    def __init__(self, app, prefixes: Tuple[str, ...], minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.prefixes = prefixes
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message, chunks = None, []
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start_message["headers"])
+            if len(body) >= self.minimum_size and "content-encoding" not in headers:
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
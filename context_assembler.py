@@ -0,0 +1,161 @@
+# context_assembler.py
+import os
+import re
+from typing import List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import metrics
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+MIN_OVERLAP_CHARS = 20  # shortest suffix/prefix match treated as splitter overlap
+MIN_DEDUP_CHARS = 30    # shorter sentences (e.g. "Dose:") may legitimately repeat
+
+_encoding = None
+
+
+def _get_encoding():
+    """cl100k_base when tiktoken and its BPE file are available, else False (character estimate)."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:  # not installed, or the BPE file cannot be fetched offline
+            _encoding = False
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    return len(encoding.encode(text)) if encoding else (len(text) + 3) // 4
+
+def truncate_tokens(text: str, budget: int) -> str:
+    encoding = _get_encoding()
+    return encoding.decode(encoding.encode(text)[:budget]) if encoding else text[:budget * 4]
+
+_SENTENCE = re.compile(r"((?<=[.!?।])\s+|\n+)")  # captured, so the separators can be put back
+
+
+# --- Merging ---
+def _text_overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def _merge_pair(left: Document, right: Document):
+    """Joins two chunks of the same page if they overlap or touch; returns None otherwise."""
+    a, b = left.page_content, right.page_content
+    start_a, start_b = left.metadata.get("start_index"), right.metadata.get("start_index")
+    if start_a is not None and start_b is not None:
+        if start_b < start_a:
+            left, right, a, b, start_a, start_b = right, left, b, a, start_b, start_a
+        if start_b > start_a + len(a):
+            return None
+        text = a + b[start_a + len(a) - start_b:]
+    elif b in a or a in b:
+        text = a if len(a) >= len(b) else b
+    else:
+        forward, backward = _text_overlap(a, b), _text_overlap(b, a)
+        if not forward and not backward:
+            return None
+        text = a + b[forward:] if forward >= backward else b + a[backward:]
+    ids = left.metadata.get("chunk_ids", [left.id]) + right.metadata.get("chunk_ids", [right.id])
+    return Document(id=left.id, page_content=text, metadata={**left.metadata, "chunk_ids": ids})
+
+def merge_chunks(docs: List[Document]) -> List[Document]:
+    """Merges overlapping/adjacent chunks from the same source page, keeping retrieval order."""
+    merged: List[Document] = []
+    for doc in docs:
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        for i, existing in enumerate(merged):
+            if (existing.metadata.get("source"), existing.metadata.get("page")) != key:
+                continue
+            combined = _merge_pair(existing, doc)
+            if combined is not None:
+                merged[i] = combined
+                break
+        else:
+            merged.append(doc)
+    return merged
+
+def drop_duplicate_sentences(docs: List[Document]) -> List[Document]:
+    """Removes sentences already present in a higher-ranked block (repeated headers, boilerplate).
+
+    Kept sentences keep the whitespace that followed them, so line breaks in
+    tables and lists survive; a block with nothing removed is passed through as is.
+    """
+    seen, result = set(), []
+    for doc in docs:
+        parts = _SENTENCE.split(doc.page_content)
+        kept, dropped = [], False
+        for sentence, separator in zip(parts[::2], parts[1::2] + [""]):
+            normalized = " ".join(sentence.lower().split())
+            if len(normalized) >= MIN_DEDUP_CHARS:
+                if normalized in seen:
+                    dropped = True
+                    continue
+                seen.add(normalized)
+            kept.append(sentence + separator)
+        if not dropped:
+            result.append(doc)
+            continue
+        text = "".join(kept).strip()
+        if text:
+            result.append(Document(id=doc.id, page_content=text, metadata=doc.metadata))
+    return result
+
+
+# --- Packing ---
+def assemble_context(docs: List[Document], budget: int = CONTEXT_TOKEN_BUDGET):
+    """Merges, dedups and packs ``docs`` into ``budget`` tokens; returns ``(docs, tokens_saved)``.
+
+    Savings are measured against what the "stuff" chain would have sent: every
+    retrieved chunk joined by a blank line.
+    """
+    original_tokens = count_tokens("\n\n".join(doc.page_content for doc in docs))
+    packed, used = [], 0
+    for doc in drop_duplicate_sentences(merge_chunks(docs)):
+        tokens = count_tokens(doc.page_content)
+        if used + tokens > budget:
+            remaining = budget - used
+            if remaining >= 50:  # a useful fragment still fits
+                packed.append(Document(id=doc.id, page_content=truncate_tokens(doc.page_content, remaining),
+                                       metadata=doc.metadata))
+            break
+        packed.append(doc)
+        used += tokens
+    assembled_tokens = count_tokens("\n\n".join(doc.page_content for doc in packed))
+    return packed, original_tokens - assembled_tokens
+
+
+class ContextAssemblingRetriever(BaseRetriever):
+    """Wraps a retriever so the chain receives merged, deduplicated, budgeted context."""
+
+    retriever: BaseRetriever
+    budget: int = CONTEXT_TOKEN_BUDGET
+    requests: int = 0
+    tokens_saved: int = 0
+
+    def _assemble(self, docs: List[Document]) -> List[Document]:
+        with metrics.stage("context_assembly"):
+            packed, saved = assemble_context(docs, self.budget)
+        self.requests += 1
+        self.tokens_saved += saved
+        print(f"🧩 Context assembly saved {saved} prompt tokens ({len(docs)} chunks -> {len(packed)} blocks)")
+        return packed
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._assemble(self.retriever.invoke(query, config={"callbacks": run_manager.get_child()}))
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        docs = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return self._assemble(docs)
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "prompt_tokens_saved": self.tokens_saved,
+                "budget": self.budget}
@@ -6,6 +6,7 @@ from pymongo import MongoClient
 from dotenv import load_dotenv
 from datetime import datetime
 from bson.objectid import ObjectId
+from async_db import bucket_append, history_version_bump
 
 load_dotenv()
 
@@ -17,6 +18,7 @@ db = client.mediguide_db
 # Define collections
 users_collection = db.users
 conversations_collection = db.conversations
+message_buckets_collection = db.message_buckets
 
 # --- Helpers ---
 def serialize_doc(doc):
@@ -50,26 +52,38 @@ def get_user_conversations(username: str):
     return [serialize_doc(c) for c in convos]
 
 def get_conversation_by_id(conversation_id: str, username: str):
-    """Fetches a single, complete conversation, ensuring the user owns it."""
+    """Fetches a single, complete conversation (all buckets, oldest first), ensuring the user owns it."""
     convo = conversations_collection.find_one({
         "_id": ObjectId(conversation_id),
         "username": username
     })
+    if not convo:
+        return None
+    messages = convo.get("messages", [])  # not yet migrated to buckets; older than every bucket
+    buckets = message_buckets_collection.find(
+        {"conversation_id": convo["_id"], "username": username}
+    ).sort([("first_at", 1), ("_id", 1)])
+    for bucket in buckets:
+        messages.extend(bucket["messages"])
+    convo["messages"] = messages
     return serialize_doc(convo)
 
 def create_conversation(username: str, first_message: dict):
-    """Creates a new conversation document."""
+    """Creates a new conversation document with its first message bucket."""
     result = conversations_collection.insert_one({
         "username": username,
         "title": first_message['content'][:50] + "...",
-        "messages": [first_message],
         "created_at": datetime.utcnow()
     })
+    add_message_to_conversation(str(result.inserted_id), first_message, username)
     return result.inserted_id
 
-def add_message_to_conversation(conversation_id: str, message: dict):
-    """Adds a message to an existing conversation's 'messages' array."""
-    conversations_collection.update_one(
-        {"_id": ObjectId(conversation_id)},
-        {"$push": {"messages": message}}
-    )
\ No newline at end of file
+def add_message_to_conversation(conversation_id: str, message: dict, username: str = None):
+    """Appends a message to the conversation's open bucket (the owner is looked up when not given)."""
+    if username is None:
+        convo = conversations_collection.find_one({"_id": ObjectId(conversation_id)}, {"username": 1})
+        if not convo:
+            return
+        username = convo["username"]
+    message_buckets_collection.update_one(*bucket_append(ObjectId(conversation_id), username, [message]), upsert=True)
+    users_collection.update_one(*history_version_bump(username))
\ No newline at end of file
@@ -0,0 +1,209 @@
+# embeddings.py
+import os
+import time
+import inspect
+import argparse
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- Configuration ---
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # "torch" or "onnx"
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models/all-MiniLM-L6-v2-onnx")
+MAX_SEQ_LENGTH = 256  # same truncation as the sentence-transformers model config
+
+PARITY_QUERIES = [
+    "What are the symptoms of dengue?",
+    "dengue ke symptoms kya hai",
+    "डेंगू के लक्षण क्या हैं?",
+    "How much paracetamol can an adult take in a day?",
+    "What does a high HbA1c mean?",
+    "Side effects of amlodipine 5mg",
+    "bukhar aur sar dard ho raha hai kya karu",
+    "How is malaria diagnosed?",
+    "normal platelet count range",
+    "When should I see a doctor for chest pain?",
+]
+
+
+def get_embedding_model(backend: str = None) -> Embeddings:
+    """Returns the MiniLM embedding model for the configured backend."""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "onnx":
+        return OnnxEmbeddings(ONNX_MODEL_DIR)
+    if backend != "torch":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}', expected 'torch' or 'onnx'.")
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+
+class OnnxEmbeddings(Embeddings):
+    """all-MiniLM-L6-v2 on onnxruntime: mean pooling + L2 normalisation, like sentence-transformers.
+
+    Loads ``model_int8.onnx`` (dynamic int8 quantisation) when present, else ``model.onnx``.
+    Build both with ``python embeddings.py export``.
+    """
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, batch_size: int = 32, threads: int = None):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_BACKEND=onnx needs the 'onnxruntime' and 'tokenizers' packages.") from e
+        model_file = os.path.join(model_dir, "model_int8.onnx")
+        if not os.path.exists(model_file):
+            model_file = os.path.join(model_dir, "model.onnx")
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+            feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feed["token_type_ids"] = np.zeros_like(input_ids)
+            hidden = self.session.run(None, feed)[0]
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            vectors.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        return np.vstack(vectors) if vectors else np.zeros((0, 384), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
+
+# --- Export ---
+def export_onnx(output_dir: str = ONNX_MODEL_DIR, quantize: bool = True):
+    """Exports MiniLM to ONNX (and an int8 dynamic-quantised copy) with its fast tokenizer."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+    model = AutoModel.from_pretrained(EMBEDDING_MODEL_NAME).eval()
+
+    class Encoder(torch.nn.Module):
+        """Pins the traced signature; positional order of the HF forward() varies across versions."""
+
+        def __init__(self, bert):
+            super().__init__()
+            self.bert = bert
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.bert(input_ids=input_ids, attention_mask=attention_mask,
+                             token_type_ids=token_type_ids).last_hidden_state
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    model_path = os.path.join(output_dir, "model.onnx")
+    dynamic = {0: "batch", 1: "sequence"}
+    # Newer torch defaults to the dynamo exporter; the TorchScript one handles dynamic_axes directly
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(model),
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            model_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic,
+                          "token_type_ids": dynamic, "last_hidden_state": dynamic},
+            opset_version=14,
+            **extra,
+        )
+    tokenizer.save_pretrained(output_dir)  # writes tokenizer.json
+    print(f"Exported {model_path}")
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantized_path = os.path.join(output_dir, "model_int8.onnx")
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        print(f"Quantized {quantized_path}")
+
+
+# --- Parity check ---
+def parity_check(queries: List[str], index_path: str = "vectorstore/db_faiss", k: int = 3) -> dict:
+    """Compares the ONNX backend against the torch model: vector cosine, top-k overlap, latency.
+
+    ``index_path`` may be a single index or a sharded one (``memory_llm.py --shard-by``);
+    shards are searched the way the server routes the queries.
+    """
+    import faiss
+    from vector_index import SHARDS_NAME
+
+    reference = get_embedding_model("torch")
+    candidate = get_embedding_model("onnx")
+    timings = {}
+    vectors = {}
+    for name, model in (("torch", reference), ("onnx", candidate)):
+        model.embed_query(queries[0])  # warm-up
+        started = time.perf_counter()
+        vectors[name] = np.array([model.embed_query(q) for q in queries], dtype=np.float32)
+        timings[name] = (time.perf_counter() - started) * 1000 / len(queries)
+
+    cosine = np.sum(vectors["torch"] * vectors["onnx"], axis=1) / (
+        np.linalg.norm(vectors["torch"], axis=1) * np.linalg.norm(vectors["onnx"], axis=1))
+    if os.path.exists(os.path.join(index_path, SHARDS_NAME)):
+        from sharded_index import ShardedIndex
+        index = ShardedIndex(index_path, candidate)
+        torch_ids, onnx_ids = (
+            [[doc.id for doc in docs] for docs in index.search_by_vectors(vectors[name], k, queries)]
+            for name in ("torch", "onnx")
+        )
+    else:
+        index = faiss.read_index(os.path.join(index_path, "index.faiss"))
+        torch_ids = index.search(vectors["torch"], k)[1].tolist()
+        onnx_ids = index.search(vectors["onnx"], k)[1].tolist()
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(torch_ids, onnx_ids)]
+    return {
+        "queries": len(queries),
+        "cosine_min": float(cosine.min()),
+        "cosine_mean": float(cosine.mean()),
+        f"top{k}_overlap_mean": float(np.mean(overlap)),
+        f"top{k}_overlap_min": float(np.min(overlap)),
+        "torch_ms_per_query": timings["torch"],
+        "onnx_ms_per_query": timings["onnx"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and validate the ONNX MiniLM embedding backend.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="Export MiniLM to ONNX and quantize it to int8.")
+    export_cmd.add_argument("--output", default=ONNX_MODEL_DIR)
+    export_cmd.add_argument("--no-quantize", action="store_true")
+    parity_cmd = sub.add_parser("parity", help="Compare ONNX vectors and retrievals with the torch model.")
+    parity_cmd.add_argument("--queries", help="Text file with one query per line (defaults to a built-in set).")
+    parity_cmd.add_argument("--index", default="vectorstore/db_faiss")
+    parity_cmd.add_argument("--k", type=int, default=3)
+    parity_cmd.add_argument("--min-cosine", type=float, default=0.98)
+    parity_cmd.add_argument("--min-overlap", type=float, default=0.9)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.output, quantize=not args.no_quantize)
+    else:
+        queries = PARITY_QUERIES
+        if args.queries:
+            with open(args.queries, encoding="utf-8") as f:
+                queries = [line.strip() for line in f if line.strip()]
+        result = parity_check(queries, args.index, args.k)
+        for key, value in result.items():
+            print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+        ok = result["cosine_min"] >= args.min_cosine and result[f"top{args.k}_overlap_mean"] >= args.min_overlap
+        print("✅ ONNX backend matches the torch model." if ok else "❌ ONNX backend drifted from the torch model.")
+        raise SystemExit(0 if ok else 1)
@@ -0,0 +1,31 @@
+# gunicorn.conf.py
+# Read automatically by `gunicorn main:app` from the working directory.
+import gc
+import os
+
+# The memory-mapped FAISS index is shared by all workers through the page cache.
+# PRELOAD_MODELS=1 also loads the embedding model in the master so the forked workers
+# share its weights, but the master only binds the port once that load is done: use it
+# only where the health-check grace period covers the model load. Set FAISS_MMAP=0 to
+# get one private copy of the index per worker again.
+os.environ.setdefault("PRELOAD_MODELS", "0")
+os.environ.setdefault("FAISS_MMAP", "1")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.environ["PRELOAD_MODELS"] == "1"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker is forked. Frozen objects
+    # are never scanned by the cyclic GC, so workers do not write to (and un-share) their pages.
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    # With PROMETHEUS_MULTIPROC_DIR set, /metrics aggregates every worker's files; drop a dead worker's gauges
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,158 @@
+# intent_router.py
+import os
+import re
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- Configuration ---
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "1") == "1"
+INTENT_ROUTER_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.6"))  # min similarity to a small-talk centroid
+INTENT_ROUTER_MARGIN = float(os.getenv("INTENT_ROUTER_MARGIN", "0.1"))  # ... and how far it must beat the medical ones
+INTENT_ROUTER_MAX_WORDS = int(os.getenv("INTENT_ROUTER_MAX_WORDS", "12"))  # longer messages always go to RAG
+
+MEDICAL = "medical"
+
+# Each inner list is averaged into one centroid, so an intent can cover several
+# languages or topics without one blurred mean vector.
+PROTOTYPES: Dict[str, List[List[str]]] = {
+    "greeting": [
+        ["hi", "hello", "hey", "hi there", "hello doctor", "good morning", "good afternoon", "good evening"],
+        ["namaste", "namaskar", "hello ji", "namaste doctor sahab", "kaise ho", "aap kaise hain"],
+        ["नमस्ते", "नमस्कार", "हेलो", "नमस्ते डॉक्टर साहब", "आप कैसे हैं"],
+    ],
+    "thanks": [
+        ["thanks", "thank you", "thank you so much", "thanks doctor", "that was helpful", "great, thanks"],
+        ["dhanyavad", "shukriya", "thank you ji", "bahut dhanyavad", "thanks doctor sahab", "bahut help hui"],
+        ["धन्यवाद", "शुक्रिया", "बहुत धन्यवाद", "आपका बहुत शुक्रिया"],
+    ],
+    "acknowledgement": [
+        ["ok", "okay", "got it", "alright", "sure", "fine", "understood", "bye", "goodbye", "see you"],
+        ["theek hai", "thik hai", "accha", "acha theek hai", "haan", "samajh gaya", "chalo bye"],
+        ["ठीक है", "अच्छा", "हाँ", "समझ गया", "अलविदा"],
+    ],
+    "out_of_scope": [
+        ["who won the cricket match", "what is the score of the football game", "ipl match result today"],
+        ["what is the weather today", "will it rain tomorrow", "temperature in delhi today"],
+        ["write python code", "help me with my maths homework", "solve this equation", "write an essay for me"],
+        ["tell me a joke", "recommend a good movie", "sing a song", "write a poem"],
+        ["what is the capital of france", "who is the prime minister", "what is the price of bitcoin"],
+        ["koi joke sunao", "aaj mausam kaisa hai", "movie suggest karo", "cricket ka score kya hai"],
+    ],
+    MEDICAL: [
+        ["what are the symptoms of dengue", "i have fever and headache", "my chest hurts", "i feel dizzy"],
+        ["how much paracetamol can i take", "side effects of amlodipine", "is ibuprofen safe in pregnancy"],
+        ["how is malaria diagnosed", "what causes diabetes", "treatment for high blood pressure"],
+        ["normal platelet count range", "what does high hba1c mean", "my cholesterol report is high"],
+        ["hi doctor, i have a cough", "hello, my child has a rash", "thanks, but what about the dose"],
+        ["bukhar aur sar dard ho raha hai", "pet mein dard hai kya karu", "dengue ke symptoms kya hai"],
+        ["मुझे बुखार है", "सिर में दर्द हो रहा है", "डेंगू के लक्षण क्या हैं", "शुगर की दवा कब लें"],
+    ],
+}
+
+REPLIES: Dict[str, Dict[str, str]] = {
+    "greeting": {
+        "en": "Hello! 👋 I'm Vaidya AI. How can I help you with your health today? You can ask me about symptoms, medicines, lab reports or diseases.",
+        "hi": "नमस्ते! 👋 मैं वैद्य AI हूँ। आज मैं आपकी सेहत से जुड़ी किस बात में मदद कर सकता हूँ? आप लक्षण, दवाइयों, लैब रिपोर्ट या बीमारियों के बारे में पूछ सकते हैं।",
+        "hinglish": "Namaste! 👋 Main Vaidya AI hoon. Aaj aapki health se judi kis cheez mein help karun? Aap symptoms, medicines, lab reports ya bimariyon ke baare mein pooch sakte hain.",
+    },
+    "thanks": {
+        "en": "You're welcome! 😊 Take care of yourself, and feel free to ask if you have any other health questions.",
+        "hi": "आपका स्वागत है! 😊 अपना ख्याल रखिए, और सेहत से जुड़ा कोई और सवाल हो तो ज़रूर पूछिए।",
+        "hinglish": "Aapka swagat hai! 😊 Apna khayal rakhiye, aur koi aur health question ho toh zaroor poochiye.",
+    },
+    "acknowledgement": {
+        "en": "Alright! 👍 Let me know if there's anything else about your health I can help with.",
+        "hi": "ठीक है! 👍 सेहत से जुड़ी किसी और बात में मदद चाहिए तो बताइए।",
+        "hinglish": "Theek hai! 👍 Health se judi kisi aur baat mein help chahiye toh bataiye.",
+    },
+    "out_of_scope": {
+        "en": "I'm a medical assistant, so I can only help with health questions: symptoms, medicines, lab reports and diseases. Is there anything health-related I can help you with?",
+        "hi": "मैं एक मेडिकल असिस्टेंट हूँ, इसलिए सिर्फ़ सेहत से जुड़े सवालों में मदद कर सकता हूँ: लक्षण, दवाइयाँ, लैब रिपोर्ट और बीमारियाँ। क्या सेहत से जुड़ा कोई सवाल है?",
+        "hinglish": "Main ek medical assistant hoon, isliye sirf health se jude sawalon mein help kar sakta hoon: symptoms, medicines, lab reports aur bimariyan. Kya koi health se juda sawal hai?",
+    },
+}
+
+_DEVANAGARI = re.compile(r"[\u0900-\u097F]")
+_HINGLISH_WORDS = frozenset(
+    "aap aapka aapki accha acha bahut dhanyavad dhanyawad haan hai hain hoon hua hui kaise karo karu kya "
+    "mera meri mujhe namaskar namaste nahi sahab samajh shukriya theek thik".split()
+)
+
+
+def detect_language(text: str) -> str:
+    """``hi`` for Devanagari, ``hinglish`` for romanised Hindi, else ``en``; picks the reply template."""
+    if _DEVANAGARI.search(text):
+        return "hi"
+    return "hinglish" if _HINGLISH_WORDS & set(re.findall(r"[a-z]+", text.lower())) else "en"
+
+
+class Route(NamedTuple):
+    intent: str
+    language: str
+    similarity: float
+    reply: Optional[str]  # None: answer with RAG + LLM
+
+
+class IntentRouter:
+    """Nearest-centroid classifier that answers small talk without retrieval or the LLM.
+
+    The prototype phrases are embedded once and averaged into unit centroids. A
+    query is compared with every centroid using the same MiniLM query embedding
+    the semantic cache and retriever use (memoized, so it is computed once).
+    Greetings, thanks, acknowledgements and out-of-scope requests get a templated
+    reply in the user's language. The router only skips RAG when the match clears
+    ``threshold`` and beats the nearest medical centroid by ``margin``; anything
+    it is unsure about is treated as medical.
+    """
+
+    def __init__(self, embeddings: Embeddings, prototypes: Dict[str, List[List[str]]] = PROTOTYPES,
+                 threshold: float = INTENT_ROUTER_THRESHOLD, margin: float = INTENT_ROUTER_MARGIN,
+                 max_words: int = INTENT_ROUTER_MAX_WORDS):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.margin = margin
+        self.max_words = max_words
+        groups = [(intent, phrases) for intent, intent_groups in prototypes.items() for phrases in intent_groups]
+        vectors = np.asarray(embeddings.embed_documents([p for _, phrases in groups for p in phrases]),
+                             dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        bounds = np.cumsum([0] + [len(phrases) for _, phrases in groups])
+        centroids = np.stack([vectors[start:end].mean(axis=0) for start, end in zip(bounds[:-1], bounds[1:])])
+        self._centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+        self._intents = [intent for intent, _ in groups]
+        self._medical = np.array([intent == MEDICAL for intent in self._intents])
+        self.counts = Counter()
+
+    def classify(self, query: str):
+        """Returns ``(intent, similarity)`` of the nearest centroid, falling back to medical when unsure."""
+        if len(query.split()) > self.max_words:
+            return MEDICAL, 0.0
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        scores = self._centroids @ (vector / norm if norm else vector)
+        best = int(np.argmax(scores))
+        intent, similarity = self._intents[best], float(scores[best])
+        if intent != MEDICAL and (similarity < self.threshold
+                                  or similarity - float(scores[self._medical].max()) < self.margin):
+            return MEDICAL, similarity
+        return intent, similarity
+
+    def route(self, query: str) -> Route:
+        intent, similarity = self.classify(query)
+        self.counts[intent] += 1
+        language = detect_language(query)
+        reply = REPLIES[intent][language] if intent != MEDICAL else None
+        return Route(intent, language, similarity, reply)
+
+    def stats(self) -> dict:
+        total = sum(self.counts.values())
+        saved = total - self.counts[MEDICAL]
+        return {
+            "routed": total,
+            "intents": dict(self.counts),
+            "llm_calls_saved": saved,
+            "saved_fraction": round(saved / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,244 @@
+# llm_router.py
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI
+
+load_dotenv()
+
+# --- Configuration ---
+GROQ_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1")
+TOGETHER_API_BASE = os.getenv("TOGETHER_API_BASE", "https://api.together.xyz/v1")
+LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS")  # JSON list overriding the default pool
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "30"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))       # consecutive failures to open
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_MIN_SAMPLES = 20  # latency samples needed before an endpoint's p95 is trusted
+
+
+class LLMEndpoint:
+    """One provider/key pair with its latency history and circuit breaker.
+
+    The breaker opens after ``LLM_BREAKER_FAILURES`` consecutive failures and lets a
+    single trial request through once ``LLM_BREAKER_COOLDOWN_SECONDS`` have passed
+    (half-open); the trial's outcome closes or re-opens it.
+    """
+
+    def __init__(self, name: str, model: str, api_key: str, base_url: str,
+                 temperature: float = 0.7, max_tokens: int = 512):
+        self.name = name
+        self.model = model
+        # Retries are the router's job: the SDK's own backoff would hide a rate-limited key
+        self.llm = ChatOpenAI(model=model, openai_api_key=api_key, openai_api_base=base_url,
+                              temperature=temperature, max_tokens=max_tokens,
+                              timeout=LLM_REQUEST_TIMEOUT_SECONDS, max_retries=0)
+        self.latencies_ms = {"complete": deque(maxlen=500), "first_token": deque(maxlen=500)}
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= LLM_BREAKER_COOLDOWN_SECONDS:
+            return "half-open"
+        return "open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self._trial_in_flight)
+
+    def begin(self):
+        if self.opened_at is not None:
+            self._trial_in_flight = True
+
+    def abandon(self):
+        """The request was cancelled (lost a hedge race); it counts neither way."""
+        self._trial_in_flight = False
+
+    def record_success(self, kind: str, latency_ms: float):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self.latencies_ms[kind].append(latency_ms)
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self._trial_in_flight or self.consecutive_failures >= LLM_BREAKER_FAILURES:
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def p95_ms(self, kind: str) -> Optional[float]:
+        samples = self.latencies_ms[kind]
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return float(np.percentile(samples, 95))
+
+    def stats(self) -> dict:
+        requests = self.successes + self.failures
+        return {
+            "model": self.model,
+            "state": self.state,
+            "successes": self.successes,
+            "failures": self.failures,
+            "error_rate": self.failures / requests if requests else 0.0,
+            "p50_ms": {kind: float(np.percentile(s, 50)) if s else None for kind, s in self.latencies_ms.items()},
+            "p95_ms": {kind: float(np.percentile(s, 95)) if s else None for kind, s in self.latencies_ms.items()},
+        }
+
+
+def endpoints_from_env() -> List[LLMEndpoint]:
+    """The endpoint pool in priority order: LLM_ENDPOINTS if set, else the Groq keys then Together."""
+    if LLM_ENDPOINTS:
+        specs = json.loads(LLM_ENDPOINTS)
+    else:
+        specs = [
+            {"name": "groq-primary", "model": "llama-3.1-8b-instant", "base_url": GROQ_API_BASE,
+             "api_key": os.getenv("PRIMARY_GROQ_API_KEY")},
+            {"name": "groq-fallback", "model": "llama-3.1-8b-instant", "base_url": GROQ_API_BASE,
+             "api_key": os.getenv("FALLBACK_GROQ_API_KEY")},
+            {"name": "together-mixtral", "model": "mistralai/Mixtral-8x7B-Instruct-v0.1", "base_url": TOGETHER_API_BASE,
+             "api_key": os.getenv("TOGETHER_API_KEY")},
+        ]
+    return [LLMEndpoint(**spec) for spec in specs if spec.get("api_key")]
+
+
+class RoutedChatModel(BaseChatModel):
+    """Chat model that fails over across a pool of OpenAI-compatible endpoints.
+
+    Endpoints are tried in priority order, skipping those whose breaker is open.
+    With ``hedge`` on, a request still running past its endpoint's p95 latency
+    (time to first token when streaming) is duplicated on the next endpoint and
+    the first success wins. Streams fail over only before their first token.
+    """
+
+    endpoints: List[Any]
+    hedge: bool = LLM_HEDGE
+    hedges: int = 0
+    hedge_wins: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-openai-compatible"
+
+    def _candidates(self) -> List[LLMEndpoint]:
+        ready = [endpoint for endpoint in self.endpoints if endpoint.available()]
+        return ready or list(self.endpoints)  # every breaker open: still try rather than fail outright
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        errors = []
+        for endpoint in self._candidates():
+            endpoint.begin()
+            started = time.perf_counter()
+            try:
+                message = endpoint.llm.invoke(messages, stop=stop, **kwargs)
+            except Exception as e:
+                endpoint.record_failure()
+                errors.append(f"{endpoint.name}: {e}")
+                continue
+            endpoint.record_success("complete", (time.perf_counter() - started) * 1000)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        raise RuntimeError(f"All LLM endpoints failed: {'; '.join(errors)}")
+
+    async def _route(self, call: Callable, kind: str, discard: Callable = None):
+        """Runs ``call(endpoint)`` with failover and optional hedging; returns the first success."""
+        candidates, errors, pending = self._candidates(), [], {}
+        next_index = 0
+
+        def launch(hedged: bool = False):
+            nonlocal next_index
+            endpoint = candidates[next_index]
+            next_index += 1
+            endpoint.begin()
+            pending[asyncio.ensure_future(call(endpoint))] = (endpoint, time.perf_counter(), hedged)
+
+        launch()
+        try:
+            while pending:
+                hedge_after = None
+                if self.hedge and len(pending) == 1 and next_index < len(candidates):
+                    endpoint, started, _ = next(iter(pending.values()))
+                    p95 = endpoint.p95_ms(kind)
+                    if p95 is not None:
+                        hedge_after = max(0.0, p95 / 1000 - (time.perf_counter() - started))
+                done, _ = await asyncio.wait(pending, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED)
+                if not done:  # slower than this endpoint's p95: race the next one
+                    self.hedges += 1
+                    launch(hedged=True)
+                    continue
+                winner = None
+                for task in done:
+                    endpoint, started, hedged = pending.pop(task)
+                    if task.exception() is not None:
+                        endpoint.record_failure()
+                        errors.append(f"{endpoint.name}: {task.exception()}")
+                    elif winner is None:
+                        endpoint.record_success(kind, (time.perf_counter() - started) * 1000)
+                        if hedged:
+                            self.hedge_wins += 1
+                        winner = task.result()
+                    elif discard:
+                        discard(task.result())
+                if winner is not None:
+                    return winner
+                if not pending and next_index < len(candidates):
+                    launch()
+        finally:
+            for task, (endpoint, _, _) in pending.items():
+                task.cancel()
+                endpoint.abandon()
+        raise RuntimeError(f"All LLM endpoints failed: {'; '.join(errors)}")
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = await self._route(lambda endpoint: endpoint.llm.ainvoke(messages, stop=stop, **kwargs), "complete")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any):
+        async def open_stream(endpoint):
+            stream = endpoint.llm.astream(messages, stop=stop, **kwargs)
+            try:
+                return await stream.__anext__(), stream
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        def close_stream(opened):
+            asyncio.ensure_future(opened[1].aclose())
+
+        first, stream = await self._route(open_stream, "first_token", discard=close_stream)
+        chunk = ChatGenerationChunk(message=first)
+        if run_manager:
+            await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+        yield chunk
+        async for message in stream:
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def stats(self) -> dict:
+        return {
+            "hedging": self.hedge,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": {endpoint.name: endpoint.stats() for endpoint in self.endpoints},
+        }
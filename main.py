@@ -1,39 +1,50 @@
 # main.py
 import os
-from fastapi import FastAPI, HTTPException, Depends
+import json
+import asyncio
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, timezone
-import db
-from db import conversations_collection, get_user_conversations
+import async_db
+from pymongo.errors import DuplicateKeyError
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from persistence import PersistenceQueue
 import auth
 from dotenv import load_dotenv
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
-from langchain_community.vectorstores import FAISS
 from contextlib import asynccontextmanager
-from bson.objectid import ObjectId
+# torch, FAISS and the LangChain chain/model packages are imported by the background
+# loader, not here; metrics and semantic_cache do pull in langchain_core (callbacks and
+# the Embeddings interface), about half a second of the import
+from semantic_cache import source_ids
+from readiness import Readiness
+from compression import PathCompressionMiddleware
+import metrics
+try:
+    import orjson
+except ImportError:  # conversation payloads fall back to the stdlib encoder
+    orjson = None
 load_dotenv()
 
+DB_FAISS_PATH = "vectorstore/db_faiss"
+STARTUP_RETRY_SECONDS = int(os.getenv("STARTUP_RETRY_SECONDS", "30"))  # wait before retrying a failed load
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "0") == "1"  # load at import, before gunicorn forks (see gunicorn.conf.py)
+READYZ_PING_TIMEOUT_SECONDS = 2
+WARMUP_QUERY = "What are the symptoms of dengue?"
+
 # --- Helper function to load LLM ---
 def load_llm():
-    """Attempt to load LLM with GROQ primary key, fallback if needed."""
-    for key in [os.getenv("PRIMARY_GROQ_API_KEY"), os.getenv("FALLBACK_GROQ_API_KEY")]:
-        if key:
-            try:
-                return ChatOpenAI(
-                    model="llama-3.1-8b-instant",
-                    openai_api_key=key,
-                    openai_api_base="https://api.groq.com/openai/v1",
-                    temperature=0.7,
-                    max_tokens=512
-                )
-            except Exception as e:
-                print(f"GROQ API key failed: {e}")
-    raise ValueError("Both GROQ API keys failed or are missing. Cannot load LLM.")
+    """Router over the configured endpoints; failover happens per request, not at construction."""
+    from llm_router import RoutedChatModel, endpoints_from_env
+    endpoints = endpoints_from_env()
+    if not endpoints:
+        raise ValueError("No LLM API keys configured (PRIMARY_GROQ_API_KEY, FALLBACK_GROQ_API_KEY, TOGETHER_API_KEY or LLM_ENDPOINTS). Cannot load LLM.")
+    return RoutedChatModel(endpoints=endpoints)
 
 # --- Pydantic Models ---
 class ChatRequest(BaseModel):
@@ -45,6 +56,7 @@ class Token(BaseModel):
     token_type: str
 
 class Conversation(BaseModel):
+    """Shape of a /conversations item, for the OpenAPI docs only: the response is not validated against it."""
     id: str
     title: str
     created_at: datetime
@@ -52,26 +64,91 @@ class Conversation(BaseModel):
 # --- Authentication ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    username = auth.verify_token(token)
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    with metrics.stage("auth"):
+        username = auth.verify_token(token)
     if not username:
         raise HTTPException(status_code=401, detail="Invalid token")
-    user = db.get_user(username)
+    user = await async_db.get_user(username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 # --- AI Setup ---
 qa_chain = None
+retriever = None
+answer_chain = None
+semantic_cache = None
+retrieval_batcher = None
+context_retriever = None
+persistence_queue = None
+llm_router = None
+intent_router = None
+index_shards = None
+readiness = Readiness(["mongo", "llm", "embedding_model", "index", "chain", "warmup"])
+startup_tasks = []
 
-@asynccontextmanager
-# @app.on_event("startup")
-async def lifespan(app: FastAPI):
-    global qa_chain
-    try:
-        llm = load_llm()
-        embed_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        db = FAISS.load_local("vectorstore/db_faiss", embed_model, allow_dangerous_deserialization=True)
+async def prepare_mongo():
+    """Creates the indexes once MongoDB answers, retrying until it does."""
+    while True:
+        try:
+            with readiness.loading("mongo"):
+                await async_db.ensure_indexes()
+            return
+        except Exception as e:
+            print(f"❌ MongoDB not ready: {e}; retrying in {STARTUP_RETRY_SECONDS}s")
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+
+async def load_step(loaded: dict, name: str, fn, *args):
+    """Runs a blocking load step off the event loop; a retry reuses the steps that already succeeded."""
+    if name not in loaded:
+        with readiness.loading(name):
+            loaded[name] = await run_in_threadpool(fn, *args)
+    return loaded[name]
+
+def load_embedding_model():
+    from embeddings import get_embedding_model
+    from semantic_cache import MemoizedQueryEmbeddings
+    # Memoized so the cache lookup and the retriever share one query embedding
+    return MemoizedQueryEmbeddings(get_embedding_model())
+
+def load_index(embed_model):
+    """The FAISS index (or its shards), plus the BM25 index when hybrid retrieval is on and one was built."""
+    from vector_index import load_vectorstore
+    from sparse_index import BM25_DIR_NAME, HYBRID_RETRIEVAL, BM25Index
+    from sharded_index import ShardedIndex
+    db = load_vectorstore(DB_FAISS_PATH, embed_model)
+    bm25 = None
+    if isinstance(db, ShardedIndex):
+        bm25 = db.sparse_index() if HYBRID_RETRIEVAL else None
+    elif HYBRID_RETRIEVAL and BM25Index.exists(DB_FAISS_PATH):
+        # BM25 catches exact drug names, dosages and lab abbreviations that MiniLM misses
+        bm25 = BM25Index(os.path.join(DB_FAISS_PATH, BM25_DIR_NAME))
+    return db, bm25
+
+async def load_rag(loaded: dict):
+    global qa_chain, retriever, answer_chain, semantic_cache, retrieval_batcher, context_retriever, llm_router, intent_router
+    global index_shards
+    llm = llm_router = await load_step(loaded, "llm", load_llm)
+    embed_model = await load_step(loaded, "embedding_model", load_embedding_model)
+    db, bm25 = await load_step(loaded, "index", load_index, embed_model)
+    db.embedding_function = embed_model  # an index preloaded without the onnx model gets this worker's
+    from sharded_index import ShardedIndex
+    index_shards = db if isinstance(db, ShardedIndex) else None
+
+    with readiness.loading("chain"):
+        from langchain_core.prompts import PromptTemplate
+        from langchain.chains import RetrievalQA
+        from batching import RETRIEVAL_BATCH_WINDOW_MS, BatchedRetriever, RetrievalBatcher
+        from sparse_index import HYBRID_CANDIDATES, HYBRID_RETRIEVAL, HybridRetriever
+        from context_assembler import ContextAssemblingRetriever
+        from semantic_cache import SemanticCache, index_version
+        from intent_router import INTENT_ROUTER, IntentRouter
+
+        cache = SemanticCache(embed_model)
+        cache.set_version(index_version(DB_FAISS_PATH))
+        # Embeds the prototype phrases once
+        router = await run_in_threadpool(IntentRouter, embed_model) if INTENT_ROUTER else None
 
         # 🟢 Rich, compassionate doctor-style prompt
         raw_prompt = """
@@ -106,20 +183,98 @@ async def lifespan(app: FastAPI):
 
         prompt_template = PromptTemplate(template=raw_prompt, input_variables=["context", "question"])
 
-        qa_chain = RetrievalQA.from_chain_type(
+        dense_k = HYBRID_CANDIDATES if bm25 is not None else 3
+        rag_retriever = db.as_retriever(search_kwargs={'k': dense_k})
+        if RETRIEVAL_BATCH_WINDOW_MS > 0:
+            if retrieval_batcher:  # left over from a failed attempt
+                await retrieval_batcher.stop()
+            # Concurrent requests share one batched embed + FAISS search
+            retrieval_batcher = RetrievalBatcher(db, k=dense_k)
+            await retrieval_batcher.start()
+            rag_retriever = BatchedRetriever(batcher=retrieval_batcher)
+        if bm25 is not None:
+            rag_retriever = HybridRetriever(dense=rag_retriever, bm25=bm25, vectorstore=db, k=3)
+        # Merge overlapping chunks and cap the context at CONTEXT_TOKEN_BUDGET tokens
+        assembler = ContextAssemblingRetriever(retriever=rag_retriever)
+        chain = RetrievalQA.from_chain_type(
             llm=llm,
             chain_type="stuff",
-            retriever=db.as_retriever(search_kwargs={'k': 3}),
+            retriever=assembler,
             return_source_documents=True,
             chain_type_kwargs={'prompt': prompt_template}
         )
-        print("✅ RAG chain with compassionate doctor prompt loaded successfully!")
+
+    with readiness.loading("warmup"):
+        # The first query pays for lazy initialisation (tokenizer, index pages, BM25 postings) here, not in a user request
+        await assembler.ainvoke(WARMUP_QUERY)
+
+    semantic_cache, context_retriever, retriever, qa_chain, intent_router = cache, assembler, assembler, chain, router
+    # Same prompt + LLM as the "stuff" chain, used directly for token streaming
+    answer_chain = prompt_template | llm
+
+async def warm_up():
+    """Loads the RAG components in the background, retrying failed steps until all are ready."""
+    loaded = dict(preloaded)
+    while True:
+        try:
+            await load_rag(loaded)
+            print("✅ RAG chain with compassionate doctor prompt loaded successfully!")
+            return
+        except Exception as e:
+            print(f"❌ Failed to load RAG chain: {e}; retrying in {STARTUP_RETRY_SECONDS}s")
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+
+def preload():
+    """Loads the embedding model and index once, in the gunicorn master before it forks.
+
+    Workers inherit the torch weights copy-on-write and the memory-mapped index
+    through the page cache, and their background loader skips both steps. An
+    onnxruntime session starts its thread pool when created, which does not
+    survive fork, so with EMBEDDING_BACKEND=onnx only the index is preloaded.
+
+    A step that fails is left to each worker's background loader, which retries
+    it while /readyz reports it, instead of taking the master down.
+    """
+    from embeddings import EMBEDDING_BACKEND
+    embed_model = None
+    try:
+        if EMBEDDING_BACKEND != "onnx":
+            with readiness.loading("embedding_model"):
+                embed_model = preloaded["embedding_model"] = load_embedding_model()
+        with readiness.loading("index"):
+            preloaded["index"] = load_index(embed_model)
     except Exception as e:
-        print(f"❌ Failed to load RAG chain: {e}")
-        
-    yield  
+        print(f"❌ Preload failed: {e}; the workers will load it in the background")
+
+preloaded = {}
+if PRELOAD_MODELS:
+    preload()
+
+@asynccontextmanager
+# @app.on_event("startup")
+async def lifespan(app: FastAPI):
+    global persistence_queue
+    async_db.connect()
+    # Chat turns are written behind the response, batched into bulk writes
+    persistence_queue = PersistenceQueue()
+    await persistence_queue.start()
+    # Models, index and Mongo indexes load in the background so /healthz answers at once
+    startup_tasks[:] = [asyncio.create_task(prepare_mongo()), asyncio.create_task(warm_up())]
+
+    yield
+    for task in startup_tasks:
+        task.cancel()
+    await asyncio.gather(*startup_tasks, return_exceptions=True)
+    if retrieval_batcher:
+        await retrieval_batcher.stop()
+    await persistence_queue.stop()  # drain queued turns before the client closes
+    async_db.close()
 
 app = FastAPI(title="VaidyAI API", lifespan=lifespan)
+# Conversation histories compress well; /chat/stream stays unbuffered
+app.add_middleware(PathCompressionMiddleware, prefixes=("/conversations",))
+# Outermost: per-request stage spans, sent back as Server-Timing and exported on /metrics
+app.add_middleware(metrics.ServerTimingMiddleware)
 
 
 # --- API Endpoints ---
@@ -127,71 +282,284 @@ app = FastAPI(title="VaidyAI API", lifespan=lifespan)
 def root():
     return {"message": "🩺 VaidyAI API is running."}
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving, whether or not the models have loaded."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the LLM, embedding model, index, chain and MongoDB are up, else 503; with load times."""
+    report = readiness.report()
+    try:
+        await asyncio.wait_for(async_db.ping(), READYZ_PING_TIMEOUT_SECONDS)
+        report["mongo_ping"] = "ok"
+    except Exception as e:
+        report["ready"] = False
+        report["mongo_ping"] = f"{type(e).__name__}: {e}"
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus histograms: per-stage and per-route latency, LLM tokens per call."""
+    if metrics.prometheus_client is None:
+        raise HTTPException(status_code=503, detail="prometheus_client is not installed")
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+@app.get("/stats")
+def stats():
+    """Hit rates, batching and queue behaviour of the retrieval, auth, persistence and LLM paths."""
+    return {
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "retrieval_batcher": retrieval_batcher.stats() if retrieval_batcher else None,
+        "context_assembler": context_retriever.stats() if context_retriever else None,
+        "auth_cache": {"tokens": auth.token_cache.stats(), "users": async_db.user_cache.stats()},
+        "password_hashing": auth.hashing_stats(),
+        "persistence_queue": persistence_queue.stats() if persistence_queue else None,
+        "llm_router": llm_router.stats() if llm_router else None,
+        "intent_router": intent_router.stats() if intent_router else None,
+        "index_shards": index_shards.stats() if index_shards else None,
+    }
+
+def hashing_busy() -> HTTPException:
+    """Fast rejection while the bcrypt pool is saturated (login bursts, reconnect storms)."""
+    return HTTPException(status_code=429, detail="Too many sign-in attempts, please retry shortly",
+                         headers={"Retry-After": "1"})
 
 @app.post("/register", status_code=201)
-def register(user: auth.UserCreate):
-    if db.get_user(user.username):
+async def register(user: auth.UserCreate):
+    if await async_db.get_user(user.username):
+        raise HTTPException(status_code=400, detail="Username already exists")
+    try:
+        hashed_password = await auth.get_password_hash_async(user.password)
+    except auth.PasswordHashingBusy:
+        raise hashing_busy()
+    try:
+        await async_db.create_user(username=user.username, hashed_password=hashed_password)
+    except DuplicateKeyError:  # lost a race with a concurrent registration
         raise HTTPException(status_code=400, detail="Username already exists")
-    hashed_password = auth.get_password_hash(user.password)
-    db.create_user(username=user.username, hashed_password=hashed_password)
     return {"message": "User registered successfully"}
 
 @app.post("/token", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = db.get_user(form_data.username)
-    if not user or not auth.verify_password(form_data.password, user["hashed_password"]):
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await async_db.get_user(form_data.username)
+    try:
+        valid = bool(user) and await auth.verify_password_async(form_data.password, user["hashed_password"])
+    except auth.PasswordHashingBusy:
+        raise hashing_busy()
+    if not valid:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     access_token = auth.create_access_token(data={"sub": user["username"]})
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/conversations", response_model=List[Conversation])
-def get_conversations(current_user: dict = Depends(get_current_user)):
-    return db.get_user_conversations(current_user["username"])
+# --- Conditional GETs ---
+# Conversation reads carry an ETag built from the user's history version, which every
+# write advances; clients revalidate with If-None-Match and get an empty 304 when unchanged.
+HISTORY_CACHE_CONTROL = "private, no-cache"
+
+async def history_etag(username: str) -> str:
+    return f'W/"{await async_db.get_history_version(username)}"'
+
+def history_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": HISTORY_CACHE_CONTROL}
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """Returns a 304 when the client already holds ``etag``."""
+    if etag in {tag.strip() for tag in request.headers.get("if-none-match", "").split(",")}:
+        return Response(status_code=304, headers=history_headers(etag))
+    return None
+
+def conversation_json(content, headers: dict) -> Response:
+    """Renders conversation payloads with orjson when installed, skipping the jsonable_encoder pass."""
+    if orjson is None:
+        return JSONResponse(jsonable_encoder(content), headers=headers)
+    return Response(orjson.dumps(content), media_type="application/json", headers=headers)
+
+@app.get("/conversations", responses={200: {"model": List[Conversation]}})
+async def get_conversations(request: Request, limit: int = Query(async_db.CONVERSATIONS_PAGE_LIMIT, ge=1, le=100),
+                            after: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """One page of conversations, newest first; X-Next-Cursor is passed back as ``after`` for the next page.
+
+    Items are serialized straight from the Mongo projection in
+    ``async_db.get_user_conversations`` (``id``, ``title``, ``created_at``), which
+    matches ``Conversation``.
+    """
+    # Read the version before the data, so a concurrent write can only make the ETag older than the body
+    etag = await history_etag(current_user["username"])
+    if cached := not_modified(request, etag):
+        return cached
+    try:
+        conversations, next_cursor = await async_db.get_user_conversations(current_user["username"], limit, after)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    headers = history_headers(etag)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return conversation_json(conversations, headers)
 
 @app.get("/conversations/{conversation_id}")
-def get_messages(conversation_id: str, current_user: dict = Depends(get_current_user)):
-    conversation = db.get_conversation_by_id(conversation_id, current_user["username"])
+async def get_messages(conversation_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    etag = await history_etag(current_user["username"])
+    if cached := not_modified(request, etag):
+        return cached
+    conversation = await async_db.get_conversation_by_id(conversation_id, current_user["username"])
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    return {"messages": conversation.get("messages", [])}
+    return conversation_json({"messages": conversation.get("messages", [])}, history_headers(etag))
+
+@app.get("/conversations/{conversation_id}/messages")
+async def get_messages_page(conversation_id: str, request: Request,
+                            limit: int = Query(async_db.MESSAGES_PAGE_LIMIT, ge=1, le=200),
+                            after: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """One page of messages, newest first; X-Next-Cursor is passed back as ``after`` for older messages."""
+    etag = await history_etag(current_user["username"])
+    if cached := not_modified(request, etag):
+        return cached
+    try:
+        result = await async_db.get_conversation_messages(conversation_id, current_user["username"], limit, after)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if result is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    messages, next_cursor = result
+    headers = history_headers(etag)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return conversation_json({"messages": messages}, headers)
+
+def ai_unavailable() -> HTTPException:
+    """503 while the RAG components are still loading (or retrying); clients back off instead of hammering."""
+    return HTTPException(status_code=503, detail="AI service is not available",
+                         headers={"Retry-After": str(min(STARTUP_RETRY_SECONDS, 10))})
+
+async def check_conversation(conversation_id: Optional[str], username: str):
+    """404 unless ``conversation_id`` is None (a new chat) or one of the user's conversations; runs before the LLM call."""
+    if conversation_id is None:
+        return
+    try:
+        oid = ObjectId(conversation_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    # A conversation started a moment ago may still be waiting in the write-behind queue
+    if not persistence_queue.owns_unwritten(oid, username) and not await async_db.conversation_exists(oid, username):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+def save_chat_turn(username: str, convo_id: Optional[str], prompt: str, ai_response: str):
+    """Queues one user/assistant exchange for write-behind persistence and returns the conversation id."""
+    user_message = {"role": "user", "content": prompt, "timestamp": datetime.now(timezone.utc)}
+    assistant_message = {"role": "assistant", "content": ai_response, "timestamp": datetime.now(timezone.utc)}
+    return persistence_queue.enqueue(username, convo_id, [user_message, assistant_message])
+
+async def route_intent(prompt: str):
+    """The router's templated reply for greetings, thanks and out-of-scope prompts; None sends the prompt to RAG."""
+    if intent_router is None:
+        return None
+    with metrics.stage("intent"):
+        # Embeds the prompt; the cache lookup and retriever reuse the memoized vector
+        route = await run_in_threadpool(intent_router.route, prompt)
+    return route if route.reply is not None else None
+
+async def cache_lookup(prompt: str):
+    if semantic_cache is None:
+        return None
+    with metrics.stage("cache_lookup"):
+        return await run_in_threadpool(semantic_cache.lookup, prompt)
 
 @app.post("/chat")
-def chat_endpoint(request: ChatRequest, current_user: dict = Depends(get_current_user)):
+async def chat_endpoint(request: ChatRequest, current_user: dict = Depends(get_current_user)):
     if qa_chain is None:
-        raise HTTPException(status_code=503, detail="AI service is not available")
+        raise ai_unavailable()
+    await check_conversation(request.conversation_id, current_user["username"])
     try:
-        response = qa_chain.invoke({"query": request.prompt})
-        ai_response = response["result"]
-        username = current_user["username"]
-        convo_id = request.conversation_id
-        user_message = {"role": "user", "content": request.prompt, "timestamp": datetime.now(timezone.utc)}
-        assistant_message = {"role": "assistant", "content": ai_response, "timestamp": datetime.now(timezone.utc)}
-        if convo_id:
-            db.add_message_to_conversation(convo_id, user_message)
-            db.add_message_to_conversation(convo_id, assistant_message)
+        routed = await route_intent(request.prompt)
+        cached = None if routed else await cache_lookup(request.prompt)
+        if routed:
+            ai_response, sources = routed.reply, []
+        elif cached:
+            ai_response, sources = cached["answer"], cached["sources"]
         else:
-            new_convo_id = db.create_conversation(username, user_message)
-            db.add_message_to_conversation(str(new_convo_id), assistant_message)
-            convo_id = str(new_convo_id)
-        return {"response": ai_response, "conversation_id": convo_id}
+            response = await qa_chain.ainvoke({"query": request.prompt},
+                                              config={"callbacks": [metrics.StageTimingCallback()]})
+            ai_response = response["result"]
+            sources = source_ids(response["source_documents"])
+            if semantic_cache:
+                with metrics.stage("cache_put"):
+                    await run_in_threadpool(semantic_cache.put, request.prompt, ai_response, sources)
+        convo_id = save_chat_turn(current_user["username"], request.conversation_id, request.prompt, ai_response)
+        return {"response": ai_response, "conversation_id": convo_id, "sources": sources, "cached": cached is not None,
+                "intent": routed.intent if routed else "medical"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+# --- Streaming chat (Server-Sent Events) ---
+def sse_event(event: str, data: dict) -> str:
+    """Formats a single Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, current_user: dict = Depends(get_current_user)):
+    """Streams the answer token by token; the finished turn is saved when the stream completes."""
+    if retriever is None or answer_chain is None:
+        raise ai_unavailable()
+    username = current_user["username"]
+    await check_conversation(request.conversation_id, username)
+
+    async def event_stream():
+        try:
+            routed = await route_intent(request.prompt)
+            cached = None if routed else await cache_lookup(request.prompt)
+            if routed:
+                ai_response, sources = routed.reply, []
+                yield sse_event("token", {"content": ai_response})
+            elif cached:
+                ai_response, sources = cached["answer"], cached["sources"]
+                yield sse_event("token", {"content": ai_response})
+            else:
+                timing = {"callbacks": [metrics.StageTimingCallback()]}
+                docs = await retriever.ainvoke(request.prompt, config=timing)
+                # Matches the "stuff" chain: page contents joined by a blank line
+                context = "\n\n".join(doc.page_content for doc in docs)
+                parts = []
+                async for chunk in answer_chain.astream({"context": context, "question": request.prompt},
+                                                        config=timing):
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield sse_event("token", {"content": chunk.content})
+                ai_response = "".join(parts)
+                sources = source_ids(docs)
+                if semantic_cache:
+                    with metrics.stage("cache_put"):
+                        await run_in_threadpool(semantic_cache.put, request.prompt, ai_response, sources)
+            convo_id = save_chat_turn(username, request.conversation_id, request.prompt, ai_response)
+            # Server-Timing left with the response headers, before any of this ran
+            timings = {name: round(ms, 1) for name, ms in (metrics.current_spans() or {}).items()}
+            yield sse_event("done", {"conversation_id": convo_id, "sources": sources, "cached": cached is not None,
+                                     "intent": routed.intent if routed else "medical", "timings": timings})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
     
 # --- Delete all conversations ---
 @app.delete("/conversations")
-def delete_all_user_conversations(current_user: dict = Depends(get_current_user)):
-    result = conversations_collection.delete_many({"username": current_user["username"]})
-    return {"message": f"Deleted {result.deleted_count} conversations"}
+async def delete_all_user_conversations(current_user: dict = Depends(get_current_user)):
+    deleted_count = await async_db.delete_user_conversations(current_user["username"])
+    return {"message": f"Deleted {deleted_count} conversations"}
 
 # --- Delete a single conversation ---
 @app.delete("/conversations/{conversation_id}")
-def delete_conversation(conversation_id: str, current_user: dict = Depends(get_current_user)):
+async def delete_conversation(conversation_id: str, current_user: dict = Depends(get_current_user)):
     try:
-        result = conversations_collection.delete_one({
-            "_id": ObjectId(conversation_id),
-            "username": current_user["username"]
-        })
-        if result.deleted_count == 0:
+        deleted_count = await async_db.delete_conversation(conversation_id, current_user["username"])
+        if deleted_count == 0:
             raise HTTPException(status_code=404, detail="Conversation not found")
         return {"message": "Conversation deleted successfully"}
     except Exception as e:
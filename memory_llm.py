@@ -1,42 +1,357 @@
-from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
+import os
+import re
+import glob
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from embeddings import get_embedding_model
+from chunk_store import CHUNK_STORE_NAME, write_chunk_store
+from sparse_index import BM25_DIR_NAME, build_bm25_from_vectorstore
+from sharded_index import text_language
+from vector_index import (
+    DEFAULT_INDEX_SPEC, INDEX_REPORT_NAME, INDEX_SPEC_NAME, SHARDS_NAME, convert_vectorstore, evaluate_index,
+    index_spec_file, is_flat, load_index_spec, parse_index_spec, print_report, sample_queries, supports_removal,
+)
+
+Data_path = "data/"
+DB_FAISS_PATH = "vectorstore/db_faiss"
+MANIFEST_NAME = "manifest.json"
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+DEFAULT_BATCH_SIZE = 256
+SHARD_BY = ("source", "language")
+LANGUAGE_SAMPLE_PAGES = 3  # pages read to tell a Hindi PDF from an English one
 
 # step 1: Load raw pdf
 
-Data_path="data/"
-def load_pdf_files(data):
-    loader = DirectoryLoader(data,
-                             glob='*.pdf',
-                             loader_cls=PyPDFLoader)
-    doc =loader.load()
-    return doc
+def list_pdf_files(data, recursive=False):
+    pattern = os.path.join(data, "**", "*.pdf") if recursive else os.path.join(data, "*.pdf")
+    return sorted(glob.glob(pattern, recursive=recursive))
+
+def load_pdf_file(path):
+    return PyPDFLoader(path).load()
 
-docs = load_pdf_files(data=Data_path)
-print(len(docs))
 # step 2: Create Chunks
 
 def create_chunks(extracted_data):
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size = 500,
-        chunk_overlap =50
+        chunk_overlap =50,
+        add_start_index = True  # lets the server merge overlapping chunks exactly
     )
     text_chunks = text_splitter.split_documents(extracted_data)
     return text_chunks
 
-text_chunks = create_chunks(extracted_data=docs)
-
 # step 3: create vector embeddings
 
 def get_embed():
-    embed_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2") 
+    embed_model = get_embedding_model()
     return embed_model
 
-embedding_model = get_embed() 
 # step 4: store embeddings in faiss
 
-DB_FAISS_PATH = "vectorstore/db_faiss"
-db = FAISS.from_documents(text_chunks, embedding_model)
-db.save_local(DB_FAISS_PATH)
-    
+# --- Manifest: per-file content hash -> chunk ids in the index ---
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_ids_for(relative_path, digest, count):
+    """Chunk ids come from the file content and its path under data/.
+
+    Unchanged files keep their ids, and byte-identical copies at different paths
+    get ids of their own, so removing one copy leaves the other's chunks in place.
+    """
+    prefix = hashlib.sha256(f"{relative_path}\0{digest}".encode("utf-8")).hexdigest()[:16]
+    return [f"{prefix}-{i:05d}" for i in range(count)]
+
+def load_manifest(db_path):
+    path = os.path.join(db_path, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"files": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_index_atomically(db, manifest, db_path, extra_files=None):
+    """Writes the index, chunk store, BM25 index, manifest and extra files to a sibling directory, then swaps it in.
+
+    Readers never see a half-written index or an index/manifest pair from different runs.
+    """
+    parent = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = f"{db_path}.tmp-{os.getpid()}"
+    old_path = f"{db_path}.old-{os.getpid()}"
+    db.save_local(tmp_path)
+    write_chunk_store(db.docstore, db.index_to_docstore_id, tmp_path)
+    build_bm25_from_vectorstore(db, tmp_path)
+    with open(os.path.join(tmp_path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    for name, content in (extra_files or {}).items():
+        with open(os.path.join(tmp_path, name), "w", encoding="utf-8") as f:
+            json.dump(content, f, indent=2)
+    if os.path.exists(db_path):
+        os.replace(db_path, old_path)
+    os.replace(tmp_path, db_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+# --- Streaming pipeline: parse in worker processes, embed in fixed-size batches ---
+def parse_pdf(path, digest, data_path):
+    """Runs in a worker process: loads one PDF and splits it into id-tagged chunks."""
+    pages = load_pdf_file(path)
+    chunks = create_chunks(pages)
+    relative_path = os.path.relpath(path, data_path).replace(os.sep, "/")
+    return path, digest, len(pages), chunks, chunk_ids_for(relative_path, digest, len(chunks))
+
+def iter_parsed_files(paths, digests, workers, data_path):
+    """Yields parsed files in order while at most ``2 * workers`` files are in flight."""
+    if workers <= 1:
+        for path in paths:
+            yield parse_pdf(path, digests[path], data_path)
+        return
+    # spawn, not fork: the parent may already hold torch/OpenMP threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(parse_pdf, path, digests[path], data_path))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def iter_chunk_batches(parsed_files, batch_size, manifest_files, stats):
+    """Flattens parsed files into batches of ``(chunk_id, chunk)``, recording each file in the manifest."""
+    batch = []
+    for path, digest, page_count, chunks, ids in parsed_files:
+        manifest_files[path] = {"hash": digest, "chunk_ids": ids}
+        stats["pages"] += page_count
+        for chunk_id, chunk in zip(ids, chunks):
+            batch.append((chunk_id, chunk))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def print_throughput(stats, started, final=False):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"{'Done' if final else '...'}: {stats['pages']} pages ({stats['pages'] / elapsed:.1f} pages/s), "
+          f"{stats['chunks']} chunks ({stats['chunks'] / elapsed:.1f} chunks/s) in {elapsed:.1f}s")
+
+def plan_changes(current, old_files):
+    """Splits PDFs into unchanged / to-embed and lists chunk ids that must leave the index."""
+    unchanged = [p for p in current if p in old_files and old_files[p]["hash"] == current[p]]
+    to_embed = [p for p in current if p not in unchanged]
+    stale_ids = [cid for p, entry in old_files.items() if p not in unchanged for cid in entry["chunk_ids"]]
+    return unchanged, to_embed, stale_ids
+
+def load_eval_queries(path, embedding_model):
+    with open(path, encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    return np.array(embedding_model.embed_documents(queries), dtype=np.float32)
+
+def ingest(data_path, db_path, embedding_model, incremental=False,
+           workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE,
+           index_spec=None, eval_queries=None, eval_samples=200, eval_k=3, paths=None):
+    """Builds or updates the FAISS index from ``paths`` (default: the PDFs in ``data_path``).
+
+    Returns counts of reused/recomputed/removed chunks.
+    """
+    has_index = os.path.exists(os.path.join(db_path, "index.faiss"))
+    existing_spec = load_index_spec(db_path) if has_index else DEFAULT_INDEX_SPEC
+    index_spec = index_spec or existing_spec
+    parse_index_spec(index_spec)  # fail on a bad spec before any work
+    manifest = load_manifest(db_path) if incremental and has_index else {"files": {}}
+    if incremental and not manifest["files"]:
+        print("No manifest found next to the index, doing a full build.")
+    elif incremental and index_spec != existing_spec:
+        print(f"Index type changes from '{existing_spec}' to '{index_spec}', doing a full build.")
+        manifest = {"files": {}}
+    old_files = manifest["files"]
+    current = {path: file_hash(path) for path in (paths if paths is not None else list_pdf_files(data_path))}
+
+    unchanged, to_embed, stale_ids = plan_changes(current, old_files)
+    if stale_ids and not supports_removal(index_spec):
+        print(f"'{index_spec}' cannot remove chunks of changed or deleted PDFs, doing a full build.")
+        old_files = {}
+        unchanged, to_embed, stale_ids = plan_changes(current, old_files)
+    report = {
+        "files_unchanged": len(unchanged),
+        "files_embedded": len(to_embed),
+        "chunks_reused": sum(len(old_files[p]["chunk_ids"]) for p in unchanged),
+        "chunks_recomputed": 0,
+        "chunks_removed": len(stale_ids),
+    }
+    if old_files and not to_embed and not stale_ids:
+        print("Index is up to date.")
+        return report
+
+    db = FAISS.load_local(db_path, embedding_model, allow_dangerous_deserialization=True) if old_files else None
+    if db is not None and stale_ids:
+        db.delete(stale_ids)
+
+    new_manifest = {"files": {p: old_files[p] for p in unchanged}}
+    stats = {"pages": 0, "chunks": 0}
+    started = time.perf_counter()
+    parsed = iter_parsed_files(to_embed, current, workers, data_path)
+    for n, batch in enumerate(iter_chunk_batches(parsed, batch_size, new_manifest["files"], stats), 1):
+        texts = [chunk.page_content for _, chunk in batch]
+        text_embeddings = list(zip(texts, embedding_model.embed_documents(texts)))
+        metadatas = [chunk.metadata for _, chunk in batch]
+        ids = [chunk_id for chunk_id, _ in batch]
+        if db is None:
+            db = FAISS.from_embeddings(text_embeddings, embedding_model, metadatas=metadatas, ids=ids)
+        else:
+            db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        stats["chunks"] += len(batch)
+        if n % 10 == 0:
+            print_throughput(stats, started)
+    print_throughput(stats, started, final=True)
+    report["chunks_recomputed"] = stats["chunks"]
+
+    if db is None:
+        print("No chunks to index.")
+        return report
+
+    # Fresh builds stream into a flat index; other index types are built from it at the end,
+    # and the flat index doubles as the exact baseline for the recall/latency report.
+    extra_files = {INDEX_SPEC_NAME: index_spec_file(index_spec)}
+    if not old_files and not is_flat(index_spec):
+        queries = load_eval_queries(eval_queries, embedding_model) if eval_queries \
+            else sample_queries(db.index, eval_samples)
+        flat_index = db.index
+        db = convert_vectorstore(db, index_spec)
+        index_report = evaluate_index(flat_index, db.index, queries, eval_k)
+        index_report["query_set"] = "held_out" if eval_queries else "in_corpus_proxy"
+        print_report(index_spec, index_report)
+        extra_files[INDEX_REPORT_NAME] = dict(index_report, spec=index_spec)
+    save_index_atomically(db, new_manifest, db_path, extra_files)
+    return report
+
+# --- Shards: one index per source collection or language ---
+def source_collection(path, data_path):
+    """First folder under data/ (data/hindi_books/x.pdf -> "hindi_books"); PDFs directly in data/ are "general"."""
+    parts = os.path.relpath(path, data_path).split(os.sep)
+    return re.sub(r"[^\w-]+", "_", parts[0].lower()) if len(parts) > 1 else "general"
+
+def pdf_language(path):
+    pages = []
+    for page in PyPDFLoader(path).lazy_load():
+        pages.append(page.page_content)
+        if len(pages) == LANGUAGE_SAMPLE_PAGES:
+            break
+    return text_language("\n".join(pages))
+
+def load_shards_file(db_path):
+    path = os.path.join(db_path, SHARDS_NAME)
+    if not os.path.exists(path):
+        return {"shard_by": None, "shards": {}, "files": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def assign_shards(digests, data_path, shard_by, old_files):
+    """Shard of each PDF; an unchanged file keeps the language detected by the previous build."""
+    shards = {}
+    for path, digest in digests.items():
+        if shard_by == "source":
+            shards[path] = source_collection(path, data_path)
+        elif path in old_files and old_files[path]["hash"] == digest:
+            shards[path] = old_files[path]["shard"]
+        else:
+            shards[path] = pdf_language(path)
+    return shards
+
+def ingest_sharded(data_path, db_path, embedding_model, shard_by, incremental=False, **kwargs):
+    """Builds one index directory per shard under ``db_path`` and lists them in ``shards.json``.
+
+    Each shard is an ordinary index, so incremental updates, index types and the
+    BM25 index work per shard. Returns the ``ingest`` report of each shard.
+    """
+    layout = load_shards_file(db_path)
+    if layout["shard_by"] not in (None, shard_by):
+        print(f"Shards were split by {layout['shard_by']}, now by {shard_by}: rebuilding every shard.")
+        incremental = False
+    old_files = layout["files"] if layout["shard_by"] == shard_by else {}
+    digests = {path: file_hash(path) for path in list_pdf_files(data_path, recursive=True)}
+    shard_of = assign_shards(digests, data_path, shard_by, old_files)
+
+    groups = {}
+    for path, shard in shard_of.items():
+        groups.setdefault(shard, []).append(path)
+    reports, shards = {}, {}
+    for shard, paths in sorted(groups.items()):
+        print(f"Shard '{shard}': {len(paths)} PDFs")
+        shard_path = os.path.join(db_path, shard)
+        reports[shard] = ingest(data_path, shard_path, embedding_model, incremental=incremental, paths=paths, **kwargs)
+        if os.path.exists(os.path.join(shard_path, "index.faiss")):
+            manifest = load_manifest(shard_path)
+            shards[shard] = {
+                "language": shard if shard_by == "language" else None,
+                "files": len(paths),
+                "chunks": sum(len(entry["chunk_ids"]) for entry in manifest["files"].values()),
+            }
+
+    layout = {
+        "shard_by": shard_by,
+        "shards": shards,
+        "files": {path: {"hash": digests[path], "shard": shard} for path, shard in shard_of.items()},
+    }
+    tmp_path = os.path.join(db_path, f"{SHARDS_NAME}.tmp-{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(layout, f, indent=2)
+    os.replace(tmp_path, os.path.join(db_path, SHARDS_NAME))
+
+    # Shards whose PDFs are all gone, and a single index built here before sharding
+    leftovers = [name for name in os.listdir(db_path) if os.path.isdir(os.path.join(db_path, name))
+                 and name not in shards and os.path.exists(os.path.join(db_path, name, MANIFEST_NAME))]
+    leftovers += [name for name in ("index.faiss", "index.pkl", CHUNK_STORE_NAME, BM25_DIR_NAME, MANIFEST_NAME,
+                                    INDEX_SPEC_NAME, INDEX_REPORT_NAME)
+                  if name not in shards and os.path.exists(os.path.join(db_path, name))]
+    for name in leftovers:
+        path = os.path.join(db_path, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the VaidyAI FAISS index from the PDFs in data/.")
+    parser.add_argument("--data", default=Data_path)
+    parser.add_argument("--db", default=DB_FAISS_PATH)
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only embed new or changed PDFs and update the existing index in place.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Processes used to parse and split PDFs (1 = parse in this process).")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Chunks embedded and appended to the index per batch.")
+    parser.add_argument("--index", default=None,
+                        help="Index spec, e.g. 'Flat', 'HNSW32,efSearch=64' or 'IVF1024,PQ16,nprobe=16' "
+                             "(defaults to the existing index type, else Flat).")
+    parser.add_argument("--eval-queries", help="Text file of held-out queries (one per line) for the recall report.")
+    parser.add_argument("--eval-k", type=int, default=3)
+    parser.add_argument("--shard-by", choices=SHARD_BY,
+                        help="Build one index per source folder under --data (source) or per PDF language "
+                             "(language) instead of a single index; the API searches the shards in parallel.")
+    args = parser.parse_args()
+
+    options = dict(incremental=args.incremental, workers=args.workers, batch_size=args.batch_size,
+                   index_spec=args.index, eval_queries=args.eval_queries, eval_k=args.eval_k)
+    if args.shard_by:
+        reports = ingest_sharded(args.data, args.db, get_embed(), args.shard_by, **options)
+    else:
+        reports = {None: ingest(args.data, args.db, get_embed(), **options)}
+    for shard, report in reports.items():
+        print(f"{f'[{shard}] ' if shard else ''}"
+              f"Reused {report['chunks_reused']} chunks from {report['files_unchanged']} unchanged files; "
+              f"recomputed {report['chunks_recomputed']} chunks from {report['files_embedded']} new/changed files; "
+              f"removed {report['chunks_removed']} stale chunks.")
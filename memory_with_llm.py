@@ -1,11 +1,11 @@
-from langchain_huggingface import HuggingFaceEmbeddings, HuggingFaceEndpoint
 import os
 # from langchain_community.chat_models import ChatOpenAI
 from langchain_openai import ChatOpenAI 
 from langchain_core.prompts import PromptTemplate
 from langchain.chains import RetrievalQA
 from dotenv import load_dotenv
-from langchain_community.vectorstores import FAISS
+from embeddings import get_embedding_model
+from vector_index import load_vectorstore
 
 
 load_dotenv()
@@ -51,8 +51,8 @@ def set_prompt(custom_prompt):
 #load data
 
 DB_FAISS_PATH = "vectorstore/db_faiss"
-embed_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2") 
-db = FAISS.load_local(DB_FAISS_PATH, embed_model, allow_dangerous_deserialization=True)
+embed_model = get_embedding_model()
+db = load_vectorstore(DB_FAISS_PATH, embed_model)  # single or sharded (memory_llm.py --shard-by) index
     
 # create QA chain    
 
@@ -0,0 +1,210 @@
+# metrics.py
+import os
+import time
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from starlette.datastructures import MutableHeaders
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # Server-Timing still works; /metrics answers 503
+    prometheus_client = None
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+if prometheus_client is not None:
+    STAGE_SECONDS = prometheus_client.Histogram(
+        "vaidya_stage_seconds", "Time spent in each hot-path stage.", ["stage"], buckets=LATENCY_BUCKETS)
+    REQUEST_SECONDS = prometheus_client.Histogram(
+        "vaidya_request_seconds", "Request latency by route.", ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+    LLM_TOKENS = prometheus_client.Histogram(
+        "vaidya_llm_tokens", "Prompt and completion tokens per LLM call.", ["kind"], buckets=TOKEN_BUCKETS)
+
+# Stage durations (ms) of the current request, set by ServerTimingMiddleware
+_spans: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_spans", default=None)
+
+
+# --- Spans ---
+def current_spans() -> Optional[Dict[str, float]]:
+    """The current request's spans; capture it before handing work to another task or thread."""
+    return _spans.get()
+
+def record(name: str, seconds: float, spans: Optional[Dict[str, float]] = None):
+    """Adds a stage duration to the request's spans (repeated stages add up) and to the histogram."""
+    spans = spans if spans is not None else _spans.get()
+    if spans is not None:
+        spans[name] = spans.get(name, 0.0) + seconds * 1000
+    if prometheus_client is not None:
+        STAGE_SECONDS.labels(stage=name).observe(seconds)
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+def timed(name: str):
+    """Decorator timing an async function as stage ``name``."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with stage(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def server_timing(spans: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in spans.items())
+
+def record_tokens(prompt_tokens: int, completion_tokens: int):
+    if prometheus_client is not None:
+        LLM_TOKENS.labels(kind="prompt").observe(prompt_tokens)
+        LLM_TOKENS.labels(kind="completion").observe(completion_tokens)
+
+
+# --- Exposition ---
+def render():
+    """Returns ``(body, content_type)`` for /metrics, aggregating gunicorn workers in multiprocess mode."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware giving each request its own spans and sending them as ``Server-Timing``.
+
+    The header goes out with the response start, so a streamed response only
+    carries the stages that finished before its first byte; /chat/stream repeats
+    the full set in its final ``done`` event.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        spans, status = {}, 500
+        token = _spans.set(spans)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total = dict(spans, total=(time.perf_counter() - started) * 1000)
+                MutableHeaders(raw=message["headers"]).append("Server-Timing", server_timing(total))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _spans.reset(token)
+            if prometheus_client is not None:
+                route = getattr(scope.get("route"), "path", "unmatched")  # templated, e.g. /conversations/{conversation_id}
+                REQUEST_SECONDS.labels(method=scope["method"], route=route, status=str(status)).observe(
+                    time.perf_counter() - started)
+
+
+class StageTimingCallback(BaseCallbackHandler):
+    """Times the LangChain runs of one request.
+
+    ``retrieve`` is the outermost retriever run, ``llm`` the model call and
+    ``llm_first_token`` its first streamed token. ``prompt`` is what remains of
+    the outermost chain once retrieval and the LLM are taken out: stuffing the
+    documents and formatting the prompt. Token counts come from the model's usage
+    metadata, or a tiktoken estimate when it has none (e.g. streamed responses).
+    """
+
+    run_inline = True
+
+    def __init__(self, spans: Optional[Dict[str, float]] = None):
+        self.spans = spans if spans is not None else _spans.get()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._depth = {"chain": 0, "retrieve": 0, "llm": 0}
+        self._started = {}
+        self._inside_chain = 0.0  # retrieval + LLM seconds within the outermost chain
+        self._prompt_text = ""
+        self._first_token = False
+
+    def _begin(self, kind: str):
+        if self._depth[kind] == 0:
+            self._started[kind] = time.perf_counter()
+        self._depth[kind] += 1
+
+    def _end(self, kind: str) -> Optional[float]:
+        self._depth[kind] = max(0, self._depth[kind] - 1)
+        if self._depth[kind] or kind not in self._started:
+            return None
+        seconds = time.perf_counter() - self._started.pop(kind)
+        if kind == "chain":
+            record("prompt", max(0.0, seconds - self._inside_chain), self.spans)
+            self._inside_chain = 0.0
+            return seconds
+        if self._depth["chain"]:
+            self._inside_chain += seconds
+        record(kind, seconds, self.spans)
+        return seconds
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], **kwargs: Any):
+        self._begin("chain")
+
+    def on_chain_end(self, outputs: Dict[str, Any], **kwargs: Any):
+        self._end("chain")
+
+    def on_chain_error(self, error: BaseException, **kwargs: Any):
+        self._end("chain")
+
+    def on_retriever_start(self, serialized: Dict[str, Any], query: str, **kwargs: Any):
+        self._begin("retrieve")
+
+    def on_retriever_end(self, documents, **kwargs: Any):
+        self._end("retrieve")
+
+    def on_retriever_error(self, error: BaseException, **kwargs: Any):
+        self._end("retrieve")
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any):
+        self._prompt_text = "\n".join(str(m.content) for batch in messages for m in batch)
+        self._first_token = False
+        self._begin("llm")
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any):
+        self._prompt_text = "\n".join(prompts)
+        self._first_token = False
+        self._begin("llm")
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        if not self._first_token and "llm" in self._started:
+            self._first_token = True
+            record("llm_first_token", time.perf_counter() - self._started["llm"], self.spans)
+
+    def on_llm_end(self, response, **kwargs: Any):
+        self._end("llm")
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            prompt_tokens, completion_tokens = usage["input_tokens"], usage["output_tokens"]
+        else:
+            from context_assembler import count_tokens
+            prompt_tokens = count_tokens(self._prompt_text)
+            completion_tokens = count_tokens(generation.text if generation else "")
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        record_tokens(prompt_tokens, completion_tokens)
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any):
+        self._end("llm")
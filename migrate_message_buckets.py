@@ -0,0 +1,66 @@
+# migrate_message_buckets.py
+"""Moves the legacy ``messages`` array of each conversation into message bucket documents.
+
+Usage:
+    python migrate_message_buckets.py [--dry-run]
+
+Safe to re-run: buckets written by an interrupted run are replaced, and a
+conversation's array is only removed after its buckets are stored. Buckets take
+the timestamp of their first message, so they sort before any buckets the
+server already appended to the same conversation.
+"""
+import asyncio
+import argparse
+
+import async_db
+
+
+def legacy_buckets(convo: dict) -> list:
+    messages = convo["messages"]
+    buckets = []
+    for start in range(0, len(messages), async_db.MESSAGE_BUCKET_SIZE):
+        chunk = messages[start:start + async_db.MESSAGE_BUCKET_SIZE]
+        buckets.append({
+            "conversation_id": convo["_id"],
+            "username": convo["username"],
+            "messages": chunk,
+            # Closed even when short: appends must land after the legacy history
+            "count": async_db.MESSAGE_BUCKET_SIZE,
+            "first_at": chunk[0].get("timestamp") or convo.get("created_at"),
+            "migrated": True,
+        })
+    return buckets
+
+async def migrate(dry_run: bool = False) -> dict:
+    """Migrates every conversation that still has a messages array, on the current async_db connection."""
+    report = {"conversations": 0, "messages": 0, "buckets": 0}
+    legacy = async_db.conversations_collection.find({"messages.0": {"$exists": True}})
+    async for convo in legacy:
+        buckets = legacy_buckets(convo)
+        report["conversations"] += 1
+        report["messages"] += len(convo["messages"])
+        report["buckets"] += len(buckets)
+        if dry_run:
+            continue
+        await async_db.message_buckets_collection.delete_many({"conversation_id": convo["_id"], "migrated": True})
+        await async_db.message_buckets_collection.insert_many(buckets)
+        await async_db.conversations_collection.update_one({"_id": convo["_id"]}, {"$unset": {"messages": ""}})
+    return report
+
+async def main(dry_run: bool) -> dict:
+    async_db.connect()
+    try:
+        await async_db.ensure_indexes()
+        return await migrate(dry_run)
+    finally:
+        async_db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert conversation message arrays into message buckets.")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be migrated.")
+    args = parser.parse_args()
+    report = asyncio.run(main(args.dry_run))
+    action = "Would migrate" if args.dry_run else "Migrated"
+    print(f"{action} {report['messages']} messages from {report['conversations']} conversations "
+          f"into {report['buckets']} buckets")
@@ -0,0 +1,223 @@
+# persistence.py
+import os
+import time
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import async_db
+import metrics
+
+# --- Configuration ---
+PERSIST_FLUSH_INTERVAL_MS = float(os.getenv("PERSIST_FLUSH_INTERVAL_MS", "50"))
+PERSIST_MAX_BATCH = int(os.getenv("PERSIST_MAX_BATCH", "200"))   # turns per bulk_write
+PERSIST_MAX_ATTEMPTS = 3
+
+
+class PersistenceQueue:
+    """Write-behind store for chat turns.
+
+    Handlers enqueue a turn and return immediately; a background task groups the
+    queued turns by conversation into one ``$push: {$each: [...]}`` on the open
+    message bucket each and sends them in a single ``bulk_write`` every
+    ``interval_ms`` or once ``max_batch`` turns are waiting. New conversations get
+    their ObjectId at enqueue time and are created by an upsert, so the id can be
+    returned before anything is written; ``owns_unwritten`` lets the next turn of
+    such a conversation through before its document exists.
+
+    Every message gets an ``id`` when it is queued. A flush that fails part-way
+    is retried only for the turns whose messages are not in a bucket yet, so a
+    retry cannot push the same message twice.
+    """
+
+    def __init__(self, interval_ms: float = PERSIST_FLUSH_INTERVAL_MS, max_batch: int = PERSIST_MAX_BATCH):
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self.flushes = 0
+        self.turns_written = 0
+        self.failed = 0
+        self.flush_latencies_ms = deque(maxlen=10_000)
+        self._pending: List[dict] = []
+        self._unwritten: Dict[ObjectId, str] = {}  # queued new conversation -> username
+        self._wakeup = None
+        self._full = None
+        self._stopping = False
+        self._task = None
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flushes everything still queued, then stops the background task."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._full.set()
+        await self._task
+        self._task = None
+
+    def enqueue(self, username: str, conversation_id: Optional[str], messages: List[dict]) -> str:
+        """Queues ``messages`` for a conversation (a new one if ``conversation_id`` is None)."""
+        if self._task is None:
+            raise RuntimeError("Persistence queue is not running")
+        messages = [{"id": str(ObjectId()), **message} for message in messages]
+        is_new = conversation_id is None
+        oid = ObjectId() if is_new else ObjectId(conversation_id)
+        if is_new:
+            self._unwritten[oid] = username
+        self._pending.append({"_id": oid, "username": username, "messages": messages, "new": is_new,
+                              "created_at": datetime.utcnow(), "attempts": 0})
+        self._wakeup.set()
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return str(oid)
+
+    def owns_unwritten(self, conversation_oid: ObjectId, username: str) -> bool:
+        """Whether the id is a new conversation of ``username`` that is queued but not yet written."""
+        return self._unwritten.get(conversation_oid) == username
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if not self._stopping and len(self._pending) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            if not self._pending:
+                self._wakeup.clear()
+            if len(self._pending) < self.max_batch and not self._stopping:
+                self._full.clear()
+            if batch:
+                await self._flush(batch)
+            if self._stopping and not self._pending:
+                return
+
+    @staticmethod
+    def _operations(batch: List[dict], applied: Set[str] = frozenset()):
+        """Returns ``(conversation_ops, bucket_ops, user_ops)`` for one flush, skipping ``applied`` turns.
+
+        Each is a list of ``(key, operation)``, keyed by conversation id or, for
+        user ops, username, so a write error can be traced back to its turns. The
+        history versions of every turn are still advanced: an extra bump only
+        costs clients a cache miss, a lost one would leave their ETags stale.
+        """
+        grouped, writes_per_user = {}, {}
+        for turn in batch:
+            writes_per_user[turn["username"]] = writes_per_user.get(turn["username"], 0) + 1
+            if turn["messages"][0]["id"] in applied:
+                continue
+            group = grouped.setdefault(turn["_id"], {**turn, "messages": []})
+            group["messages"].extend(turn["messages"])
+        conversation_ops, bucket_ops = [], []
+        for oid, group in grouped.items():
+            if group["new"]:
+                first_message = group["messages"][0]
+                conversation_ops.append((oid, UpdateOne({"_id": oid}, {"$setOnInsert": {
+                    "username": group["username"],
+                    "title": first_message["content"][:50] + "...",
+                    "created_at": group["created_at"],
+                }}, upsert=True)))
+            bucket_ops.append((oid, UpdateOne(*async_db.bucket_append(oid, group["username"], group["messages"]),
+                                              upsert=True)))
+        # Advancing the history version invalidates the ETags of the user's conversation GETs
+        user_ops = [(username, UpdateOne(*async_db.history_version_bump(username, writes)))
+                    for username, writes in writes_per_user.items()]
+        return conversation_ops, bucket_ops, user_ops
+
+    @staticmethod
+    async def _applied(batch: List[dict]) -> Set[str]:
+        """First message ids of the retried turns that already reached a bucket before the failure."""
+        retried = [turn["messages"][0]["id"] for turn in batch if turn["attempts"]]
+        applied = set()
+        if not retried:
+            return applied
+        # A turn's messages are pushed in one update, so its first message stands for all of them
+        buckets = async_db.message_buckets_collection.find({"messages.id": {"$in": retried}}, {"messages.id": 1})
+        async for bucket in buckets:
+            applied.update(message.get("id") for message in bucket["messages"])
+        return applied
+
+    async def _flush(self, batch: List[dict]):
+        started = time.perf_counter()
+        ops = []
+        try:
+            conversation_ops, bucket_ops, user_ops = self._operations(batch, await self._applied(batch))
+            if conversation_ops:  # idempotent upserts, so a retried flush cannot duplicate them
+                ops = conversation_ops
+                await async_db.conversations_collection.bulk_write([op for _, op in ops], ordered=False)
+                self._forget_new(batch)
+            if bucket_ops:
+                ops = bucket_ops
+                await async_db.message_buckets_collection.bulk_write([op for _, op in ops], ordered=False)
+            ops = user_ops
+            await async_db.users_collection.bulk_write([op for _, op in ops], ordered=False)
+            self.turns_written += len(batch)
+        except BulkWriteError as e:
+            # The server rejected these writes, so sending them again would fail the same way;
+            # the other turns of the batch are retried (the history bump is the last step, so
+            # its failures leave the messages stored)
+            errors = e.details.get("writeErrors", [])
+            rejected_keys = {ops[error["index"]][0] for error in errors}
+            if ops is user_ops:
+                rejected = []
+                self.turns_written += len(batch)
+            else:
+                rejected = [turn for turn in batch if turn["_id"] in rejected_keys]
+                self.failed += len(rejected)
+                self._forget_new(rejected)
+                self._retry([turn for turn in batch if turn["_id"] not in rejected_keys])
+            print(f"❌ Failed to persist {len(rejected)} of {len(batch)} chat turns: {errors}")
+        except PyMongoError as e:  # e.g. a timeout: any part may have applied, which _applied sorts out
+            retried = self._retry(batch)
+            print(f"⚠️ Persisting chat turns failed ({e}); retrying {retried} of {len(batch)}")
+        except Exception as e:
+            # A bug or driver mismatch: drop the batch but keep the writer alive for the turns behind it
+            self.failed += len(batch)
+            self._forget_new(batch)
+            print(f"❌ Failed to persist {len(batch)} chat turns: {e!r}")
+        self.flushes += 1
+        self.flush_latencies_ms.append((time.perf_counter() - started) * 1000)
+        metrics.record("mongo_flush", time.perf_counter() - started)
+
+    def _retry(self, turns: List[dict]) -> int:
+        """Re-queues the turns with attempts left and counts the rest as failed; returns how many were re-queued."""
+        dropped = [turn for turn in turns if turn["attempts"] + 1 >= PERSIST_MAX_ATTEMPTS]
+        retry = [turn for turn in turns if turn["attempts"] + 1 < PERSIST_MAX_ATTEMPTS]
+        self.failed += len(dropped)
+        self._forget_new(dropped)
+        for turn in retry:
+            turn["attempts"] += 1
+        self._pending[:0] = retry
+        if retry:
+            self._wakeup.set()
+        return len(retry)
+
+    def _forget_new(self, turns: List[dict]):
+        for turn in turns:
+            if turn["new"]:
+                self._unwritten.pop(turn["_id"], None)
+
+    def stats(self) -> dict:
+        latencies = np.array(self.flush_latencies_ms) if self.flush_latencies_ms else np.zeros(1)
+        return {
+            "queue_depth": len(self._pending),
+            "flushes": self.flushes,
+            "turns_written": self.turns_written,
+            "failed": self.failed,
+            "flush_latency_ms": {
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "max": float(latencies.max()),
+            },
+        }
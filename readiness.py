@@ -0,0 +1,54 @@
+# readiness.py
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable
+
+
+class Readiness:
+    """Load state and load time of each startup component, for /readyz.
+
+    ``loading(name)`` wraps a load step: the component is ``loading`` while the
+    block runs, then ``ready`` with its duration, or ``failed`` with the error
+    (which is re-raised so the caller can retry).
+    """
+
+    def __init__(self, components: Iterable[str]):
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._components: Dict[str, dict] = {
+            name: {"status": "pending", "seconds": None, "error": None, "attempts": 0} for name in components
+        }
+
+    @contextmanager
+    def loading(self, name: str):
+        with self._lock:
+            component = self._components[name]
+            component.update(status="loading", error=None)
+            component["attempts"] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            with self._lock:
+                component.update(status="failed", error=f"{type(e).__name__}: {e}")
+            raise
+        with self._lock:
+            component.update(status="ready", seconds=round(time.perf_counter() - started, 3))
+
+    def is_ready(self, name: str) -> bool:
+        with self._lock:
+            return self._components[name]["status"] == "ready"
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(c["status"] == "ready" for c in self._components.values())
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "ready": all(c["status"] == "ready" for c in self._components.values()),
+                "uptime_seconds": round(time.monotonic() - self._started, 3),
+                "components": {name: dict(c) for name, c in self._components.items()},
+            }
@@ -0,0 +1,321 @@
+# semantic_cache.py
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import metrics
+
+# --- Configuration ---
+# MiniLM scores "paracetamol dose for a child" vs "... for an adult" above 0.92, so stay strict
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(24 * 3600)))
+SEMANTIC_CACHE_REDIS_URL = os.getenv("SEMANTIC_CACHE_REDIS_URL")
+
+
+# Queries whose answer turns on a number, a dose or who the patient is: a near-identical
+# cached question about another age or amount would give the wrong dosage, so these skip the cache
+_PATIENT_SPECIFIC = re.compile(
+    r"\d|\b(?:doses?|dosage|dosing|mg|mcg|ml|tablets?|pills?|capsules?|syrup|drops|how much|how many|"
+    r"per day|a day|daily|child|children|kids?|baby|babies|infants?|toddlers?|newborn|adults?|elderly|"
+    r"teen\w*|age|aged|old|years?|months?|weeks?|pregnan\w*|breastfeed\w*|weight|kg|"
+    r"khurak|matra|kitn[aie]|bach\w*|umar|umr|saal|mahine)\b"
+    r"|खुराक|मात्रा|कितन|बच्च|शिशु|उम्र|साल|महीने|गर्भ|वज़न|वजन",
+    re.IGNORECASE,
+)
+
+# --- Helpers ---
+def is_cacheable(query: str) -> bool:
+    """False for queries mentioning numbers, doses or the patient's age group; those always go to RAG."""
+    return not _PATIENT_SPECIFIC.search(query)
+
+def index_version(index_path: str) -> str:
+    """Fingerprint of the FAISS files on disk; changes whenever memory_llm.py rebuilds them."""
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(index_path)):
+        stat = os.stat(os.path.join(index_path, name))
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def source_ids(docs) -> List[str]:
+    """Stable identifiers for retrieved chunks (docstore id, else source/page)."""
+    ids = []
+    for doc in docs:
+        if "chunk_ids" in doc.metadata:  # block merged by the context assembler
+            ids.extend(doc.metadata["chunk_ids"])
+        elif getattr(doc, "id", None):
+            ids.append(doc.id)
+        else:
+            ids.append(f"{doc.metadata.get('source', '?')}:{doc.metadata.get('page', '?')}")
+    return ids
+
+
+class MemoizedQueryEmbeddings(Embeddings):
+    """Wraps an embedding model so a query is embedded once per request.
+
+    The cache lookup and the retriever both call ``embed_query`` with the same
+    text; the second call is served from a small LRU instead of re-running MiniLM.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_entries: int = 256):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def _remember(self, text: str, vector: List[float]):
+        with self._lock:
+            self._memo[text] = vector
+            if len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            if text in self._memo:
+                self._memo.move_to_end(text)
+                return self._memo[text]
+        with metrics.stage("embed"):
+            vector = self.embeddings.embed_query(text)
+        self._remember(text, vector)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Batch version of ``embed_query``: texts not seen recently are embedded in one call."""
+        with self._lock:
+            found = {t: self._memo[t] for t in texts if t in self._memo}
+        missing = [t for t in dict.fromkeys(texts) if t not in found]
+        if missing:
+            for text, vector in zip(missing, self.embeddings.embed_documents(missing)):
+                found[text] = vector
+                self._remember(text, vector)
+        return [found[t] for t in texts]
+
+
+# --- Backends ---
+class InProcessBackend:
+    """LRU + TTL store holding the cached query vectors in one preallocated matrix."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._valid = np.zeros(self.max_entries, dtype=bool)
+            self._entries = OrderedDict()  # slot -> entry, oldest access first
+            self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def _evict(self, slot: int):
+        self._entries.pop(slot, None)
+        self._valid[slot] = False
+        self._free.append(slot)
+
+    def lookup(self, vector: np.ndarray, threshold: float) -> Optional[dict]:
+        with self._lock:
+            if not self._entries:
+                return None
+            scores = self._vectors @ vector
+            scores[~self._valid] = -1.0
+            slot = int(np.argmax(scores))
+            if scores[slot] < threshold:
+                return None
+            entry = self._entries[slot]
+            if time.time() - entry["created_at"] > self.ttl_seconds:
+                self._evict(slot)
+                return None
+            self._entries.move_to_end(slot)
+            return dict(entry, similarity=float(scores[slot]))
+
+    def put(self, vector: np.ndarray, entry: dict):
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            if not self._free:
+                oldest_slot = next(iter(self._entries))
+                self._evict(oldest_slot)
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._entries[slot] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shares cache entries between gunicorn workers through Redis.
+
+    Entries live in Redis (``SETEX`` gives the TTL, a sorted set of access times
+    gives the LRU bound). Each worker mirrors only the query vectors locally and
+    pulls entries added by other workers via an insertion-ordered sorted set, so a
+    lookup is one local matrix product plus a single ``GET`` on a hit.
+    """
+
+    def __init__(self, url: str, max_entries: int, ttl_seconds: int, namespace: str = "vaidya:semcache"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("SEMANTIC_CACHE_REDIS_URL is set but the 'redis' package is not installed.") from e
+        self.client = redis.Redis.from_url(url)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        self.version = "default"
+        self._lock = threading.Lock()
+        self._reset_mirror()
+
+    def _key(self, suffix: str) -> str:
+        return f"{self.namespace}:{self.version}:{suffix}"
+
+    def _reset_mirror(self):
+        self._ids: List[str] = []
+        self._vectors = None
+        self._last_seq = 0
+
+    def set_version(self, version: str):
+        with self._lock:
+            self.version = version
+            self._reset_mirror()
+
+    def clear(self):
+        with self._lock:
+            keys = list(self.client.scan_iter(match=self._key("*")))
+            if keys:
+                self.client.delete(*keys)
+            self._reset_mirror()
+
+    def _sync(self):
+        """Pulls vectors of entries other workers added since the last lookup."""
+        if len(self._ids) > 2 * self.max_entries:
+            self._reset_mirror()  # drop vectors of entries evicted elsewhere
+        new = self.client.zrangebyscore(self._key("added"), f"({self._last_seq}", "+inf", withscores=True)
+        if not new:
+            return
+        ids = [entry_id.decode() for entry_id, _ in new]
+        blobs = self.client.hmget(self._key("vectors"), ids)
+        fresh = [(i, np.frombuffer(b, dtype=np.float32)) for i, b in zip(ids, blobs) if b]
+        if fresh:
+            self._ids.extend(i for i, _ in fresh)
+            stacked = np.stack([v for _, v in fresh])
+            self._vectors = stacked if self._vectors is None else np.vstack([self._vectors, stacked])
+        self._last_seq = int(new[-1][1])
+
+    def _drop(self, position: int):
+        del self._ids[position]
+        self._vectors = np.delete(self._vectors, position, axis=0)
+
+    def lookup(self, vector: np.ndarray, threshold: float) -> Optional[dict]:
+        with self._lock:
+            self._sync()
+            while self._ids:
+                scores = self._vectors @ vector
+                position = int(np.argmax(scores))
+                if scores[position] < threshold:
+                    return None
+                entry_id = self._ids[position]
+                raw = self.client.get(self._key(f"entry:{entry_id}"))
+                if raw is None:  # expired or evicted by another worker
+                    self._drop(position)
+                    continue
+                self.client.zadd(self._key("used"), {entry_id: time.time()})
+                return dict(json.loads(raw), similarity=float(scores[position]))
+            return None
+
+    def put(self, vector: np.ndarray, entry: dict):
+        entry_id = uuid.uuid4().hex
+        with self._lock:
+            seq = self.client.incr(self._key("seq"))
+            pipe = self.client.pipeline()
+            pipe.setex(self._key(f"entry:{entry_id}"), self.ttl_seconds, json.dumps(entry))
+            pipe.hset(self._key("vectors"), entry_id, vector.astype(np.float32).tobytes())
+            pipe.zadd(self._key("added"), {entry_id: seq})
+            pipe.zadd(self._key("used"), {entry_id: time.time()})
+            for suffix in ("seq", "vectors", "added", "used"):
+                pipe.expire(self._key(suffix), self.ttl_seconds * 2)
+            pipe.execute()
+            overflow = self.client.zcard(self._key("used")) - self.max_entries
+            if overflow > 0:
+                evicted = [e.decode() for e, _ in self.client.zpopmin(self._key("used"), overflow)]
+                pipe = self.client.pipeline()
+                pipe.delete(*[self._key(f"entry:{e}") for e in evicted])
+                pipe.hdel(self._key("vectors"), *evicted)
+                pipe.zrem(self._key("added"), *evicted)
+                pipe.execute()
+
+    def __len__(self):
+        return int(self.client.zcard(self._key("used")))
+
+
+# --- Cache ---
+class SemanticCache:
+    """Answer cache keyed on the query embedding, scoped to one FAISS index version."""
+
+    def __init__(self, embeddings: Embeddings, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES, ttl_seconds: int = SEMANTIC_CACHE_TTL_SECONDS,
+                 redis_url: Optional[str] = SEMANTIC_CACHE_REDIS_URL):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.version = None
+        if redis_url:
+            self.backend = RedisBackend(redis_url, max_entries, ttl_seconds)
+        else:
+            self.backend = InProcessBackend(max_entries, ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def set_version(self, version: str):
+        """Binds the cache to an index build; entries from any other build are dropped."""
+        if version == self.version:
+            return
+        self.version = version
+        if isinstance(self.backend, RedisBackend):
+            self.backend.set_version(version)  # old builds live under another key prefix
+        else:
+            self.backend.clear()
+
+    def lookup(self, query: str) -> Optional[dict]:
+        """Returns ``{"answer", "sources", "similarity"}`` for a close enough cached query.
+
+        Patient-specific queries (see ``is_cacheable``) are never served from the cache.
+        """
+        if not is_cacheable(query):
+            self.bypassed += 1
+            return None
+        vector = _normalize(self.embeddings.embed_query(query))
+        entry = self.backend.lookup(vector, self.threshold)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, query: str, answer: str, sources: List[str]):
+        if not is_cacheable(query):
+            return
+        vector = _normalize(self.embeddings.embed_query(query))
+        self.backend.put(vector, {"query": query, "answer": answer, "sources": sources, "created_at": time.time()})
+
+    def stats(self) -> dict:
+        return {"entries": len(self.backend), "hits": self.hits, "misses": self.misses, "bypassed": self.bypassed,
+                "version": self.version}
@@ -0,0 +1,245 @@
+# sharded_index.py
+import os
+import re
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+
+import metrics
+from sparse_index import BM25_DIR_NAME, BM25Index
+from vector_index import FAISS_MMAP, SHARDS_NAME, load_vectorstore
+
+# --- Configuration ---
+SHARD_ROUTING = os.getenv("SHARD_ROUTING", "language")  # "language": search the query's language shards; "all"
+SHARD_SEARCH_THREADS = int(os.getenv("SHARD_SEARCH_THREADS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=SHARD_SEARCH_THREADS, thread_name_prefix="shard-search")
+
+_DEVANAGARI = re.compile(r"[\u0900-\u097F]")
+_LATIN = re.compile(r"[A-Za-z]")
+
+
+def text_language(text: str) -> str:
+    """``hi`` when Devanagari outweighs Latin script, else ``en``; romanised Hindi counts as ``en``."""
+    return "hi" if len(_DEVANAGARI.findall(text)) > len(_LATIN.findall(text)) else "en"
+
+
+class _Shard:
+    """One shard directory; its index, chunk store and BM25 index are opened on first use."""
+
+    def __init__(self, name: str, path: str, language: Optional[str]):
+        self.name = name
+        self.path = path
+        self.language = language
+        self.db = None
+        self.bm25 = None
+        self.load_seconds = None
+        self.searches = 0
+        self.latencies_ms = deque(maxlen=10_000)
+        self.lock = threading.Lock()
+
+
+class ShardedIndex:
+    """The shards written by ``memory_llm.py --shard-by``, searched as one index.
+
+    Every shard is an ordinary index directory (FAISS, chunk store, BM25) that is
+    loaded the first time a query needs it. A search fans out to the selected
+    shards in parallel threads, one batched FAISS search per shard, and keeps the
+    k nearest hits across them. With ``SHARD_ROUTING=language`` a query only
+    searches the shards of its own language, when the corpus has any.
+
+    Stands in for the LangChain FAISS store: ``as_retriever``, ``embeddings`` and
+    ``docstore`` work, ``add_documents`` does not.
+    """
+
+    def __init__(self, db_path: str, embeddings, mmap: bool = FAISS_MMAP, routing: str = SHARD_ROUTING):
+        with open(os.path.join(db_path, SHARDS_NAME), encoding="utf-8") as f:
+            layout = json.load(f)
+        self.db_path = db_path
+        self.embedding_function = embeddings
+        self.mmap = mmap
+        self.routing = routing
+        self.shard_by = layout["shard_by"]
+        self.shards: Dict[str, _Shard] = {
+            name: _Shard(name, os.path.join(db_path, name), info.get("language"))
+            for name, info in layout["shards"].items()
+        }
+        self.docstore = ShardedDocstore(self)
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def as_retriever(self, search_kwargs: Optional[dict] = None, **kwargs) -> "ShardedRetriever":
+        return ShardedRetriever(index=self, k=(search_kwargs or {}).get("k", 4), **kwargs)
+
+    def sparse_index(self) -> Optional["ShardedBM25"]:
+        """BM25 across the shards, or None when no shard was built with one."""
+        if not any(BM25Index.exists(shard.path) for shard in self.shards.values()):
+            return None
+        return ShardedBM25(self)
+
+    # --- Loading ---
+    def load(self, shard: _Shard):
+        """The shard's vector store, loaded once even when several threads ask at the same time."""
+        if shard.db is None:
+            with shard.lock:
+                if shard.db is None:
+                    started = time.perf_counter()
+                    db = load_vectorstore(shard.path, self.embedding_function, self.mmap)
+                    shard.load_seconds = round(time.perf_counter() - started, 3)
+                    shard.db = db
+                    print(f"📦 Loaded shard '{shard.name}' ({db.index.ntotal} vectors) in {shard.load_seconds}s")
+        return shard.db
+
+    def load_bm25(self, shard: _Shard) -> Optional[BM25Index]:
+        if shard.bm25 is None:
+            with shard.lock:
+                if shard.bm25 is None:
+                    shard.bm25 = BM25Index(os.path.join(shard.path, BM25_DIR_NAME)) \
+                        if BM25Index.exists(shard.path) else False
+        return shard.bm25 or None
+
+    # --- Searching ---
+    def select(self, query: Optional[str]) -> List[str]:
+        """Shards a query is searched in: those of its language under language routing, else all."""
+        if self.routing == "language" and query is not None:
+            language = text_language(query)
+            matching = [name for name, shard in self.shards.items() if shard.language == language]
+            if matching:
+                return matching
+        return list(self.shards)
+
+    def _search_shard(self, shard: _Shard, vectors: np.ndarray, k: int, spans) -> Tuple[np.ndarray, np.ndarray]:
+        db = self.load(shard)
+        started = time.perf_counter()
+        distances, rows = db.index.search(vectors, k)
+        seconds = time.perf_counter() - started
+        shard.searches += 1
+        shard.latencies_ms.append(seconds * 1000)
+        metrics.record(f"shard_{shard.name}", seconds, spans)  # fan-out threads have no request context
+        if db.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            distances = -distances  # merged smallest first, like L2
+        return distances, rows
+
+    def search_by_vectors(self, vectors, k: int, queries: Optional[List[str]] = None,
+                          spans=None) -> List[List[Document]]:
+        """Top ``k`` documents per query vector across the shards each query is routed to.
+
+        Every shard any query needs is searched once with the whole batch; each
+        query then merges only the hits of its own shards.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if queries is not None:
+            selected = [self.select(query) for query in queries]
+        else:
+            selected = [list(self.shards)] * len(vectors)
+        needed = [name for name in self.shards if any(name in names for names in selected)]
+        futures = {name: _executor.submit(self._search_shard, self.shards[name], vectors, k, spans) for name in needed}
+        hits = {name: future.result() for name, future in futures.items()}
+
+        results = []
+        for i, names in enumerate(selected):
+            candidates = sorted(
+                (float(distance), name, int(row))
+                for name in names
+                for distance, row in zip(hits[name][0][i], hits[name][1][i])
+                if row != -1
+            )
+            docs = []
+            for _, name, row in candidates[:k]:
+                db = self.shards[name].db
+                doc = db.docstore.search(db.index_to_docstore_id[row])
+                if isinstance(doc, Document):
+                    docs.append(doc)
+            results.append(docs)
+        return results
+
+    def stats(self) -> dict:
+        shards = {}
+        for name, shard in self.shards.items():
+            latencies = np.array(shard.latencies_ms) if shard.latencies_ms else np.zeros(1)
+            shards[name] = {
+                "language": shard.language,
+                "loaded": shard.db is not None,
+                "vectors": shard.db.index.ntotal if shard.db is not None else None,
+                "load_seconds": shard.load_seconds,
+                "searches": shard.searches,
+                "search_ms": {"p50": float(np.percentile(latencies, 50)), "p95": float(np.percentile(latencies, 95))},
+            }
+        return {"shard_by": self.shard_by, "routing": self.routing, "shards": shards}
+
+
+class ShardedDocstore(Docstore):
+    """Resolves a chunk id in whichever loaded shard holds it (ids are content hashes)."""
+
+    def __init__(self, index: ShardedIndex):
+        self.index = index
+
+    def search(self, search: str) -> Union[str, Document]:
+        for shard in self.index.shards.values():
+            if shard.db is not None:
+                doc = shard.db.docstore.search(search)
+                if isinstance(doc, Document):
+                    return doc
+        return f"ID {search} not found."
+
+    def add(self, texts):
+        raise NotImplementedError("Shards are read-only; rebuild them with memory_llm.py.")
+
+    def delete(self, ids):
+        raise NotImplementedError("Shards are read-only; rebuild them with memory_llm.py.")
+
+
+class ShardedBM25:
+    """BM25 over the shards a query is routed to, merged by score.
+
+    Scores use each shard's own document statistics, which is close enough for
+    reciprocal rank fusion. The shard's vector store is loaded too, so the
+    docstore can resolve the hits.
+    """
+
+    def __init__(self, index: ShardedIndex):
+        self.index = index
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        hits = []
+        for name in self.index.select(query):
+            shard = self.index.shards[name]
+            bm25 = self.index.load_bm25(shard)
+            if bm25 is not None:
+                self.index.load(shard)
+                hits.extend(bm25.search(query, k))
+        return sorted(hits, key=lambda hit: hit[1], reverse=True)[:k]
+
+
+class ShardedRetriever(BaseRetriever):
+    """Dense retriever over a ShardedIndex (used when retrieval batching is off)."""
+
+    index: Any
+    k: int = 4
+
+    def _search(self, query: str) -> List[Document]:
+        vector = self.index.embeddings.embed_query(query)
+        started = time.perf_counter()
+        docs = self.index.search_by_vectors([vector], self.k, [query], metrics.current_spans())[0]
+        metrics.record("faiss_search", time.perf_counter() - started)
+        return docs
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._search(query)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        return await run_in_executor(None, self._search, query)  # copies the request context into the thread
@@ -0,0 +1,176 @@
+# sparse_index.py
+import os
+import re
+import json
+import math
+import time
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import metrics
+
+BM25_DIR_NAME = "bm25"
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))  # per retriever, before fusion
+RRF_K = 60
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+
+# Keeps dosages ("500mg"), abbreviations ("HbA1c") and dotted/slashed terms ("b.i.d", "mg/dl")
+# together; Devanagari vowel signs are not \w, so the block is listed explicitly.
+_TOKEN = re.compile(r"[\w\u0900-\u097F]+(?:[./\-][\w\u0900-\u097F]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+# --- Building ---
+def build_bm25(chunk_ids: List[str], texts: List[str], out_dir: str):
+    """Writes a compact inverted index: vocabulary, CSR postings (doc, tf) and doc lengths.
+
+    Arrays are plain ``.npy`` files so the server can memory-map them.
+    """
+    postings = {}
+    doc_lengths = np.zeros(len(texts), dtype=np.int32)
+    for doc, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        doc_lengths[doc] = sum(counts.values())
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((doc, tf))
+
+    vocab = sorted(postings)
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    for i, term in enumerate(vocab):
+        offsets[i + 1] = offsets[i] + len(postings[term])
+    docs = np.empty(offsets[-1], dtype=np.int32)
+    tfs = np.empty(offsets[-1], dtype=np.uint16)
+    for i, term in enumerate(vocab):
+        entries = np.array(postings[term], dtype=np.int64)
+        docs[offsets[i]:offsets[i + 1]] = entries[:, 0]
+        tfs[offsets[i]:offsets[i + 1]] = np.minimum(entries[:, 1], np.iinfo(np.uint16).max)
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(out_dir, "docs.npy"), docs)
+    np.save(os.path.join(out_dir, "tfs.npy"), tfs)
+    np.save(os.path.join(out_dir, "doc_lengths.npy"), doc_lengths)
+    with open(os.path.join(out_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    with open(os.path.join(out_dir, "chunk_ids.json"), "w", encoding="utf-8") as f:
+        json.dump(chunk_ids, f)
+
+def build_bm25_from_vectorstore(db, db_path: str):
+    """Indexes every chunk of a LangChain FAISS store, in FAISS row order."""
+    chunk_ids = [db.index_to_docstore_id[i] for i in range(db.index.ntotal)]
+    texts = [db.docstore.search(chunk_id).page_content for chunk_id in chunk_ids]
+    build_bm25(chunk_ids, texts, os.path.join(db_path, BM25_DIR_NAME))
+
+
+# --- Searching ---
+class BM25Index:
+    """Okapi BM25 over the memory-mapped inverted index written by ``build_bm25``."""
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.docs = np.load(os.path.join(path, "docs.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"), mmap_mode="r")
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "chunk_ids.json"), encoding="utf-8") as f:
+            self.chunk_ids = json.load(f)
+        self.avg_length = float(np.mean(self.doc_lengths)) if len(self.doc_lengths) else 0.0
+
+    @staticmethod
+    def exists(db_path: str) -> bool:
+        return os.path.exists(os.path.join(db_path, BM25_DIR_NAME, "offsets.npy"))
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        n_docs = len(self.doc_lengths)
+        doc_parts, score_parts = [], []
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = np.asarray(self.docs[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype=np.float32)
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_lengths[docs]) / self.avg_length)
+            doc_parts.append(docs)
+            score_parts.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        if not doc_parts:
+            return []
+        # Sum contributions per candidate doc without allocating a corpus-sized array
+        candidates, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        top = np.argsort(-scores)[:k] if len(scores) <= k else np.argpartition(-scores, k)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunk_ids[candidates[i]], float(scores[i])) for i in top]
+
+
+# --- Hybrid retrieval ---
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int, rrf_k: int = RRF_K) -> List[str]:
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+def _doc_key(doc: Document, rank: int) -> str:
+    """The docstore id, which BM25 hits use too; load_vectorstore sets it on every document.
+
+    A document without one (from some other store) gets a key of its own, so it
+    is never merged with a different chunk that happens to have the same text.
+    """
+    return doc.id if doc.id is not None else f"unkeyed-{rank}"
+
+
+class HybridRetriever(BaseRetriever):
+    """Runs the dense retriever and BM25 in parallel and merges them with reciprocal rank fusion."""
+
+    dense: BaseRetriever
+    bm25: Any
+    vectorstore: Any
+    k: int = 3
+    candidates: int = HYBRID_CANDIDATES
+
+    def _fuse(self, dense_docs: List[Document], sparse_hits: List[Tuple[str, float]]) -> List[Document]:
+        by_key = {_doc_key(doc, rank): doc for rank, doc in enumerate(dense_docs)}
+        fused = reciprocal_rank_fusion([list(by_key), [chunk_id for chunk_id, _ in sparse_hits]], self.k)
+        results = []
+        for key in fused:
+            doc = by_key.get(key) or self.vectorstore.docstore.search(key)
+            if isinstance(doc, Document):
+                results.append(doc)
+        return results
+
+    def _sparse_search(self, query: str, spans) -> List[Tuple[str, float]]:
+        started = time.perf_counter()
+        hits = self.bm25.search(query, self.candidates)
+        metrics.record("bm25", time.perf_counter() - started, spans)  # the executor thread has no request context
+        return hits
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        sparse = _executor.submit(self._sparse_search, query, metrics.current_spans())
+        dense_docs = self.dense.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self._fuse(dense_docs, sparse.result())
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        loop = asyncio.get_running_loop()
+        dense_docs, sparse_hits = await asyncio.gather(
+            self.dense.ainvoke(query, config={"callbacks": run_manager.get_child()}),
+            loop.run_in_executor(_executor, self._sparse_search, query, metrics.current_spans()),
+        )
+        return self._fuse(dense_docs, sparse_hits)
@@ -0,0 +1,99 @@
+# tests/test_persistence.py
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("mongomock_motor")
+
+from bson.objectid import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import async_db
+from persistence import PERSIST_MAX_ATTEMPTS, PersistenceQueue
+
+
+def message(content: str) -> dict:
+    return {"role": "user", "content": content, "timestamp": datetime.now(timezone.utc)}
+
+def fail_with(collection, errors: list, before=None) -> list:
+    """Makes the collection's next ``bulk_write`` calls raise ``errors`` in turn; later calls go through.
+
+    ``before`` runs at the start of every call. Returns the errors raised so far.
+    """
+    real = collection.bulk_write
+    raised = []
+
+    async def bulk_write(operations, **kwargs):
+        if before:
+            before()
+        if len(raised) < len(errors):
+            raised.append(errors[len(raised)])
+            raise raised[-1]
+        return await real(operations, **kwargs)
+
+    collection.bulk_write = bulk_write
+    return raised
+
+async def stored_contents() -> list:
+    return [m["content"] async for bucket in async_db.message_buckets_collection.find({})
+            for m in bucket["messages"]]
+
+
+def test_writer_survives_a_non_mongo_error():
+    async def scenario():
+        async_db.connect("mongomock://")
+        queue = PersistenceQueue(interval_ms=1)
+        await queue.start()
+        raised = fail_with(async_db.message_buckets_collection, [TypeError("unexpected keyword argument 'sort'")])
+        queue.enqueue("alice", None, [message("lost")])
+        await asyncio.sleep(0.05)
+        kept_id = queue.enqueue("alice", None, [message("kept")])
+        await queue.stop()  # drains the queue; re-raised the TypeError when the writer had died
+        kept = await async_db.conversations_collection.find_one({"username": "alice", "title": "kept..."})
+        return queue, raised, kept_id, kept, await stored_contents()
+
+    queue, raised, kept_id, kept, contents = asyncio.run(scenario())
+    assert raised
+    assert contents == ["kept"]
+    assert str(kept["_id"]) == kept_id
+    assert queue.stats()["failed"] == 1
+    assert queue.stats()["turns_written"] == 1
+    assert not queue._unwritten
+
+def test_new_conversation_stays_visible_until_its_last_retry():
+    async def scenario():
+        async_db.connect("mongomock://")
+        queue = PersistenceQueue(interval_ms=1)
+        await queue.start()
+        owned, conversation = [], {}
+        fail_with(async_db.conversations_collection, [AutoReconnect("down")] * (PERSIST_MAX_ATTEMPTS - 1),
+                  before=lambda: owned.append(queue.owns_unwritten(conversation["oid"], "alice")))
+        conversation["oid"] = ObjectId(queue.enqueue("alice", None, [message("hello")]))
+        await queue.stop()
+        return queue, owned, conversation["oid"], await stored_contents()
+
+    queue, owned, oid, contents = asyncio.run(scenario())
+    # Not in the database yet on any attempt, so a follow-up /chat relies on the queue; forgotten once written
+    assert owned == [True] * PERSIST_MAX_ATTEMPTS
+    assert not queue.owns_unwritten(oid, "alice")
+    assert contents == ["hello"]
+    assert queue.stats()["failed"] == 0
+
+def test_bulk_write_error_fails_only_the_rejected_turns():
+    async def scenario():
+        async_db.connect("mongomock://")
+        queue = PersistenceQueue(interval_ms=50)
+        await queue.start()
+        rejected = BulkWriteError({"writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]})
+        fail_with(async_db.message_buckets_collection, [rejected])
+        queue.enqueue("alice", None, [message("rejected")])
+        queue.enqueue("bob", None, [message("accepted")])
+        await queue.stop()
+        return queue, await stored_contents()
+
+    queue, contents = asyncio.run(scenario())
+    assert contents == ["accepted"]
+    assert queue.stats()["failed"] == 1
+    assert queue.stats()["turns_written"] == 1
+    assert not queue._unwritten
@@ -0,0 +1,44 @@
+# tests/test_semantic_cache.py
+import re
+
+from langchain_core.embeddings import Embeddings
+
+from semantic_cache import SEMANTIC_CACHE_THRESHOLD, SemanticCache, is_cacheable
+
+
+class TopicEmbeddings(Embeddings):
+    """Embeds a query by its drug/disease words only, so queries that differ in who
+    the patient is or how much they take look identical: the worst case for the cache."""
+
+    TOPICS = ["paracetamol", "ibuprofen", "dengue", "malaria", "symptoms", "treatment"]
+
+    def embed_query(self, text):
+        words = set(re.findall(r"[a-z]+", text.lower()))
+        return [1.0 if topic in words else 0.0 for topic in self.TOPICS] + [0.01]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def test_default_threshold_is_strict():
+    assert SEMANTIC_CACHE_THRESHOLD >= 0.97
+
+def test_dosage_for_another_age_group_is_not_served_from_cache():
+    cache = SemanticCache(TopicEmbeddings())
+    cache.put("paracetamol dose for an adult", "Adults: 500-1000 mg every 4-6 hours, at most 4 g a day.", ["a"])
+    assert cache.lookup("paracetamol dose for a child") is None
+    assert cache.stats()["entries"] == 0  # the adult answer was never stored either
+    assert cache.stats()["bypassed"] == 1
+
+def test_general_questions_still_hit():
+    cache = SemanticCache(TopicEmbeddings())
+    cache.put("what are the symptoms of dengue", "Fever, headache, joint pain and rash.", ["b"])
+    hit = cache.lookup("dengue symptoms?")
+    assert hit is not None and hit["answer"].startswith("Fever")
+
+def test_patient_specific_queries_skip_the_cache():
+    for query in ["paracetamol dose for a child", "Side effects of amlodipine 5mg", "Is ibuprofen safe in pregnancy?",
+                  "bachche ko kitni dawai de", "बच्चे को बुखार की दवा की खुराक"]:
+        assert not is_cacheable(query), query
+    for query in ["What are the symptoms of dengue?", "How is malaria diagnosed?", "डेंगू के लक्षण क्या हैं?"]:
+        assert is_cacheable(query), query
@@ -1,11 +1,13 @@
 import streamlit as st
-from langchain_huggingface import HuggingFaceEmbeddings, HuggingFaceEndpoint
 import os
 from langchain_openai import ChatOpenAI 
 from langchain_core.prompts import PromptTemplate
 from langchain.chains import RetrievalQA
 from dotenv import load_dotenv
-from langchain_community.vectorstores import FAISS
+from embeddings import get_embedding_model
+from vector_index import load_vectorstore
+from semantic_cache import MemoizedQueryEmbeddings
+from intent_router import INTENT_ROUTER, IntentRouter
 
 load_dotenv()
 TOGETHER_API_KEY = st.secrets["TOGETHER_API_KEY"]
@@ -64,17 +66,22 @@ def load_llm():
 #         temperature=0.7,
 #         max_tokens=512
 #     )
-# def is_greeting(message):
-#     greetings = ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening']
-#     return any(greet in message.lower() for greet in greetings)
-
 DB_FAISS_PATH = "vectorstore/db_faiss"
+@st.cache_resource
+def get_embeddings():
+    # Memoized: the intent router and the retriever embed each prompt once between them
+    return MemoizedQueryEmbeddings(get_embedding_model())
+
 @st.cache_resource
 def get_vectorstore():
-    embed_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2") 
-    db = FAISS.load_local(DB_FAISS_PATH, embed_model, allow_dangerous_deserialization=True)
+    embed_model = get_embeddings()
+    db = load_vectorstore(DB_FAISS_PATH, embed_model)
     return db
 
+@st.cache_resource
+def get_intent_router():
+    return IntentRouter(get_embeddings())
+
 def set_prompt(custom_prompt):
     prompt = PromptTemplate(template=custom_prompt, input_variables=["context", "question"])
     return prompt
@@ -94,12 +101,6 @@ def main():
     if prompt:
         st.chat_message('user').markdown(prompt)
         st.session_state.messages.append({'role':'user', 'content':prompt})
-        # if is_greeting(prompt):
-        #     response = "Hello! 👋 How can I assist you with your medical queries today?"
-        #     st.chat_message('assistant').markdown(response)
-        #     st.session_state.messages.append({'role': 'assistant', 'content': response})
-            
-        # else:
         raw_prompt = """
             You are a compassionate, knowledgeable, and trustworthy medical assistant, like a kind doctor speaking directly to the patient.
                 Your role is to give **accurate**, **polite**, and **helpful** medical answers based on the provided context, and to communicate in a way the patient feels understood and cared for.
@@ -130,27 +131,33 @@ def main():
                 Final Answer:
                 """
 
-        try:
-            vectorstore = get_vectorstore()
-            if vectorstore is None:
-                st.error("Failed to load the vectorstore")
-            qa_chain = RetrievalQA.from_chain_type(
-                llm = load_llm(),
-                chain_type = "stuff",
-                retriever = vectorstore.as_retriever(search_kwargs = {'k':3}),
-                return_source_documents = True,
-                chain_type_kwargs =  {'prompt':set_prompt(raw_prompt) }
-            )
+        route = get_intent_router().route(prompt) if INTENT_ROUTER else None
+        if route is not None and route.reply is not None:
+            # Greetings, thanks and off-topic messages get a templated reply without retrieval or the LLM
+            st.chat_message('assistant').markdown(route.reply)
+            st.session_state.messages.append({'role': 'assistant', 'content': route.reply})
+        else:
+            try:
+                vectorstore = get_vectorstore()
+                if vectorstore is None:
+                    st.error("Failed to load the vectorstore")
+                qa_chain = RetrievalQA.from_chain_type(
+                    llm = load_llm(),
+                    chain_type = "stuff",
+                    retriever = vectorstore.as_retriever(search_kwargs = {'k':3}),
+                    return_source_documents = True,
+                    chain_type_kwargs =  {'prompt':set_prompt(raw_prompt) }
+                )
         
-            with st.spinner("Thinking..."):
-                response = qa_chain.invoke({"query": prompt})
-                result = response["result"]
-                source_docs = response["source_documents"]
-            res_to_show = result
-            st.chat_message('assistant').markdown(res_to_show)
-            st.session_state.messages.append({'role':'assistant', 'content':res_to_show})
-        except Exception as e:
-            st.error(f"⚠️ Something went wrong: {e}")
+                with st.spinner("Thinking..."):
+                    response = qa_chain.invoke({"query": prompt})
+                    result = response["result"]
+                    source_docs = response["source_documents"]
+                res_to_show = result
+                st.chat_message('assistant').markdown(res_to_show)
+                st.session_state.messages.append({'role':'assistant', 'content':res_to_show})
+            except Exception as e:
+                st.error(f"⚠️ Something went wrong: {e}")
             
     # --- Footer section (Place this at the end) ---
         st.markdown("""
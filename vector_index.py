@@ -0,0 +1,211 @@
+# vector_index.py
+import os
+import json
+import time
+import pickle
+from typing import Optional
+
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+from chunk_store import CHUNK_STORE_NAME, has_chunk_store, open_chunk_store
+
+INDEX_SPEC_NAME = "index_spec.json"
+INDEX_REPORT_NAME = "index_report.json"
+SHARDS_NAME = "shards.json"  # present when memory_llm.py built one index per shard (see sharded_index.py)
+DEFAULT_INDEX_SPEC = "Flat"
+# Map index.faiss read-only instead of copying it into each process; workers share it via the page cache
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0") == "1"
+
+# Parameters applied after the index is built (build-time ones are applied before adding vectors)
+SEARCH_PARAMS = {"efSearch", "nprobe"}
+BUILD_PARAMS = {"efConstruction"}
+
+
+# --- Index specs ---
+def parse_index_spec(spec: str):
+    """Splits a spec such as ``HNSW32,efSearch=64`` or ``IVF1024,PQ16,nprobe=16``.
+
+    Tokens without ``=`` form the FAISS ``index_factory`` string; ``name=value``
+    tokens are build/search parameters.
+    """
+    factory, params = [], {}
+    for token in (t.strip() for t in spec.split(",") if t.strip()):
+        if "=" in token:
+            name, value = token.split("=", 1)
+            if name not in SEARCH_PARAMS | BUILD_PARAMS:
+                raise ValueError(f"Unknown index parameter '{name}' in spec '{spec}'.")
+            params[name] = int(value)
+        else:
+            factory.append(token)
+    if not factory:
+        raise ValueError(f"Index spec '{spec}' has no index type.")
+    return ",".join(factory), params
+
+def is_flat(spec: str) -> bool:
+    return parse_index_spec(spec)[0] == "Flat"
+
+def supports_removal(spec: str) -> bool:
+    """HNSW graphs cannot drop vectors; Flat and IVF indexes can."""
+    return not parse_index_spec(spec)[0].startswith("HNSW")
+
+def apply_search_params(index, params: dict):
+    space = faiss.ParameterSpace()
+    for name, value in params.items():
+        if name in SEARCH_PARAMS:
+            space.set_index_parameter(index, name, value)
+
+def build_index(spec: str, vectors: np.ndarray):
+    """Creates, trains (IVF) and fills a FAISS index from ``vectors``."""
+    factory, params = parse_index_spec(spec)
+    index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_L2)
+    if "efConstruction" in params:
+        faiss.downcast_index(index).hnsw.efConstruction = params["efConstruction"]
+    if not index.is_trained:
+        nlist = getattr(faiss.extract_index_ivf(index), "nlist", 0)
+        if len(vectors) < nlist:
+            raise ValueError(f"'{spec}' needs at least {nlist} vectors to train, got {len(vectors)}.")
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index, params)
+    return index
+
+def convert_vectorstore(db: FAISS, spec: str) -> FAISS:
+    """Rebuilds a flat LangChain FAISS store with another index type, keeping ids and docstore."""
+    vectors = db.index.reconstruct_n(0, db.index.ntotal)
+    return FAISS(
+        embedding_function=db.embedding_function,
+        index=build_index(spec, vectors),
+        docstore=db.docstore,
+        index_to_docstore_id=db.index_to_docstore_id,
+    )
+
+
+# --- Persistence ---
+def load_index_spec(db_path: str) -> str:
+    path = os.path.join(db_path, INDEX_SPEC_NAME)
+    if not os.path.exists(path):
+        return DEFAULT_INDEX_SPEC  # indexes built before specs existed are flat
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["spec"]
+
+def index_spec_file(spec: str) -> dict:
+    factory, params = parse_index_spec(spec)
+    return {"spec": spec, "factory": factory, "params": params}
+
+def _chunk_store_is_current(db_path: str) -> bool:
+    if not has_chunk_store(db_path):
+        return False
+    pickle_path = os.path.join(db_path, "index.pkl")
+    if os.path.exists(pickle_path) and \
+            os.path.getmtime(pickle_path) > os.path.getmtime(os.path.join(db_path, CHUNK_STORE_NAME)):
+        print("⚠️ chunks.sqlite is older than index.pkl, loading the pickled docstore instead.")
+        return False
+    return True
+
+def read_index(path: str, mmap: bool = False):
+    """Reads a FAISS index; with ``mmap`` its vectors stay in the file, mapped read-only.
+
+    ``IO_FLAG_MMAP_IFC`` (faiss >= 1.10) maps the flat codes behind Flat, HNSW and
+    IVF indexes; older builds only have ``IO_FLAG_MMAP``, which maps IVF lists.
+    """
+    if not mmap:
+        return faiss.read_index(path)
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    return faiss.read_index(path, flags)
+
+def load_vectorstore(db_path: str, embeddings, mmap: bool = FAISS_MMAP) -> FAISS:
+    """Loads whichever index type memory_llm.py built and re-applies its search parameters.
+
+    Chunks are read lazily from ``chunks.sqlite`` when present; ``index.pkl`` is the fallback.
+    Either way every document carries its docstore id as ``Document.id``.
+    With ``mmap`` the index is read-only: search works, ``add_documents`` does not.
+    A sharded build comes back as a ``ShardedIndex`` whose shards load on first use.
+    """
+    if os.path.exists(os.path.join(db_path, SHARDS_NAME)):
+        from sharded_index import ShardedIndex  # imports this module
+        return ShardedIndex(db_path, embeddings, mmap)
+    if _chunk_store_is_current(db_path):
+        docstore, index_to_docstore_id = open_chunk_store(db_path)
+    else:
+        with open(os.path.join(db_path, "index.pkl"), "rb") as f:  # what FAISS.load_local unpickles
+            docstore, index_to_docstore_id = pickle.load(f)
+        # Older pickles hold documents without ids; hybrid fusion keys every hit on its docstore id
+        for chunk_id, doc in docstore._dict.items():
+            if doc.id is None:
+                doc.id = chunk_id
+    db = FAISS(
+        embedding_function=embeddings,
+        index=read_index(os.path.join(db_path, "index.faiss"), mmap),
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+    apply_search_params(db.index, parse_index_spec(load_index_spec(db_path))[1])
+    return db
+
+
+# --- Search ---
+def search_by_vectors(db: FAISS, vectors, k: int):
+    """One FAISS search for many query vectors; returns a list of documents per query."""
+    _, rows = db.index.search(np.asarray(vectors, dtype=np.float32), k)
+    results = []
+    for row in rows:
+        docs = []
+        for i in row:
+            if i == -1:
+                continue
+            doc = db.docstore.search(db.index_to_docstore_id[int(i)])
+            if isinstance(doc, Document):
+                docs.append(doc)
+        results.append(docs)
+    return results
+
+
+# --- Evaluation ---
+def _latencies_ms(index, queries: np.ndarray, k: int):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query[None, :], k)
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+def evaluate_index(flat_index, ann_index, queries: np.ndarray, k: int = 3) -> dict:
+    """Recall@k of ``ann_index`` against exact flat search, plus p50/p99 single-query latency."""
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    _, truth = flat_index.search(queries, k)
+    _, found = ann_index.search(queries, k)
+    recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth.tolist(), found.tolist())])
+    flat_p50, flat_p99 = _latencies_ms(flat_index, queries, k)
+    ann_p50, ann_p99 = _latencies_ms(ann_index, queries, k)
+    return {
+        "queries": len(queries),
+        "k": k,
+        f"recall@{k}": float(recall),
+        "flat_p50_ms": flat_p50,
+        "flat_p99_ms": flat_p99,
+        "index_p50_ms": ann_p50,
+        "index_p99_ms": ann_p99,
+    }
+
+def sample_queries(index, count: int, seed: int = 0) -> np.ndarray:
+    """Stored chunk vectors used as proxy queries when no query file is given.
+
+    Every proxy query is itself in the index, so recall on them is optimistic;
+    reports built this way are marked ``query_set: in_corpus_proxy``.
+    """
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(index.ntotal, size=min(count, index.ntotal), replace=False)
+    return np.vstack([index.reconstruct(int(i)) for i in ids])
+
+def print_report(spec: str, report: Optional[dict]):
+    if not report:
+        return
+    k = report["k"]
+    print(f"Index '{spec}': recall@{k}={report[f'recall@{k}']:.3f} over {report['queries']} queries, "
+          f"p50={report['index_p50_ms']:.3f}ms p99={report['index_p99_ms']:.3f}ms "
+          f"(flat p50={report['flat_p50_ms']:.3f}ms p99={report['flat_p99_ms']:.3f}ms)")
+    if report.get("query_set") == "in_corpus_proxy":
+        print("⚠️ Recall was measured on in-corpus proxy queries (stored chunk vectors) and overstates "
+              "held-out recall; pass --eval-queries for a real estimate.")